@@ -0,0 +1,360 @@
+"""
+Command line entry point to migrate datamesh entities from starburst files
+
+The starburst client is imported only by the commands contacting an instance, so
+``validate``, ``plan`` and ``bench`` start without loading it.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+
+def _load_connections(path: str):
+    """
+    Builds the source and destination connection infos from a yaml or json file.
+
+    The file has a 'src' and a 'dest' mapping, each one holding the keyword arguments of
+    StarburstConnectionInfo (host, port, username, password, ...).
+    """
+    import yaml
+    from starburst_api.classes.class_starburst_connection_info import (
+        StarburstConnectionInfo,
+    )
+
+    with open(path, "r") as file:
+        connections = yaml.safe_load(file)
+    return (
+        StarburstConnectionInfo(**connections["src"]),
+        StarburstConnectionInfo(**connections["dest"]),
+    )
+
+
+def _budget(value: str):
+    """Parses a PHASE=SECONDS phase budget."""
+    phase, _, seconds = value.partition("=")
+    if phase not in ("fetch", "transform", "write"):
+        raise argparse.ArgumentTypeError(
+            f"unknown phase {phase!r}, expected fetch, transform or write"
+        )
+    try:
+        return phase, float(seconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid duration {seconds!r}") from None
+
+
+def _migrator(args):
+    from datamesh_migration.migrators.datamesh_migrators import DatameshMigrator
+    from datamesh_migration.migrators.deadline import Deadline
+
+    if not args.connections:
+        raise SystemExit("--connections is required by this command")
+    deadline = None
+    if args.deadline is not None or args.call_timeout is not None or args.budget:
+        deadline = Deadline(
+            timeout=args.deadline,
+            call_timeout=args.call_timeout,
+            phase_budgets=dict(args.budget),
+        )
+    return DatameshMigrator(
+        *_load_connections(args.connections),
+        rollback_path=getattr(args, "rollback", None),
+        coalesce_lookups=not args.no_coalesce,
+        profiler=args.profiler,
+        deadline=deadline,
+    )
+
+
+def _plan_file(file):
+    """Lists the migrations described by a StarburstFile, without contacting any instance."""
+    domains = file.domains
+    steps = []
+    if file.migrate_domain:
+        steps.append(f"migrate domain {domains.src}")
+    if file.products is None:
+        steps.append(f"migrate all products of domain {domains.src} into {domains.dest}")
+        return steps
+    for product in file.products:
+        if product.datasets is not None:
+            for dataset in product.datasets:
+                steps.append(
+                    f"migrate {dataset.type} {domains.src}/{product.src}/{dataset.name}"
+                    f" into {domains.dest}/{dataset.product_dest or product.dest}"
+                )
+        elif product.dest is not None:
+            steps.append(
+                f"migrate all datasets of {domains.src}/{product.src}"
+                f" into {domains.dest}/{product.dest}"
+            )
+        else:
+            steps.append(
+                f"migrate product {domains.src}/{product.src} into domain {domains.dest}"
+            )
+    return steps
+
+
+def _count_files(directory: str):
+    """Counts the .starburst files of a directory, valid or not."""
+    return sum(
+        1 for filename in os.listdir(directory) if filename.endswith(".starburst")
+    )
+
+
+def _validate(args):
+    from datamesh_migration.files.starburst_files import read_starburst_files
+
+    total = _count_files(args.directory)
+    valid = len(read_starburst_files(args.directory, profiler=args.profiler))
+    result = {"files": total, "valid": valid, "invalid": total - valid}
+    return result, valid == total
+
+
+def _plan(args):
+    from datamesh_migration.files.starburst_files import read_starburst_files
+
+    result = {
+        file.label: _plan_file(file)
+        for file in read_starburst_files(
+            args.directory, as_class=True, profiler=args.profiler
+        )
+    }
+    # The invalid files are left out of the plan
+    return result, len(result) == _count_files(args.directory)
+
+
+def _apply(args):
+    report = _migrator(args).migrate_from_starburst_files(
+        args.directory,
+        max_workers=args.workers,
+        state_path=args.state,
+        shards=args.shards,
+    )
+    return report.as_dict(), report.ok
+
+
+def _mirror(args):
+    from datamesh_migration.files.starburst_descriptors import (
+        DomainPair,
+        StarburstFile,
+    )
+
+    report = _migrator(args).migrate_files(
+        [
+            StarburstFile(DomainPair(domain, domain), migrate_domain=True)
+            for domain in args.domains
+        ],
+        max_workers=args.workers,
+        shards=args.shards,
+    )
+    return report.as_dict(), report.ok
+
+
+def _rollback(args):
+    result = _migrator(args).rollback(args.journals, max_workers=args.workers)
+    return result, not result["failed"]
+
+
+def _verify(args):
+    report = _migrator(args).verify_from_starburst_files(
+        args.directory, max_workers=args.workers
+    )
+    return report.as_dict(), report.ok
+
+
+def _bench(args):
+    from datamesh_migration.files.starburst_files import read_starburst_files
+
+    durations = []
+    files = []
+    for _ in range(args.repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            files = read_starburst_files(
+                args.directory, as_class=True, profiler=args.profiler
+            )
+            durations.append(time.perf_counter() - start)
+    best = min(durations)
+    result = {
+        "files": len(files),
+        "repeat": args.repeat,
+        "best": round(best, 6),
+        "mean": round(sum(durations) / len(durations), 6),
+        "files_per_second": round(len(files) / best, 1) if best else None,
+    }
+    return result, True
+
+
+def _print_text(result, stream):
+    if isinstance(result, dict):
+        for key, value in result.items():
+            if isinstance(value, list):
+                print(f"{key}:", file=stream)
+                for item in value:
+                    print(f"  - {item}", file=stream)
+            else:
+                print(f"{key}: {value}", file=stream)
+    else:
+        print(result, file=stream)
+
+
+def build_parser():
+    """
+    Builds the parser of the ``datamesh-migrate`` command.
+
+    Returns:
+        argparse.ArgumentParser: The command line parser.
+    """
+    parser = argparse.ArgumentParser(
+        prog="datamesh-migrate",
+        description="Migrate datamesh entities from one starburst instance to another",
+    )
+    parser.add_argument(
+        "--format",
+        choices=("text", "json"),
+        default="text",
+        help="Output format of the result. With json, the migration logs go to stderr",
+    )
+    parser.add_argument(
+        "--connections",
+        help="Yaml or json file with the 'src' and 'dest' connection infos",
+    )
+    parser.add_argument(
+        "--no-coalesce",
+        action="store_true",
+        help="Send every domain and product lookup, even when an identical one is in flight",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        metavar="SECONDS",
+        help="Stop migrating after this duration, unfinished files are reported as pending",
+    )
+    parser.add_argument(
+        "--call-timeout",
+        type=float,
+        metavar="SECONDS",
+        help="Maximum duration of each fetch from an instance, writes are never interrupted",
+    )
+    parser.add_argument(
+        "--budget",
+        type=_budget,
+        action="append",
+        default=[],
+        metavar="PHASE=SECONDS",
+        help="Maximum cumulated duration of the fetch, transform or write calls",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="DIRECTORY",
+        help="Write cProfile and tracemalloc reports of the run to this directory",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_command(
+        name, handler, help_text, directory=True, workers=False, migrate=False
+    ):
+        command = commands.add_parser(name, help=help_text)
+        if directory:
+            command.add_argument(
+                "directory", help="Directory containing the .starburst files"
+            )
+        if workers:
+            command.add_argument(
+                "--workers",
+                type=int,
+                default=8,
+                help="Maximum number of concurrent workers (default: 8)",
+            )
+        if migrate:
+            command.add_argument(
+                "--rollback",
+                help="Journal recording the destination entities before they are overwritten",
+            )
+            command.add_argument(
+                "--shards",
+                type=int,
+                default=1,
+                help="Number of worker processes, each one migrating whole destination domains",
+            )
+        command.set_defaults(handler=handler)
+        return command
+
+    add_command("validate", _validate, "Check the .starburst files")
+    add_command("plan", _plan, "List the migrations described by the .starburst files")
+    apply_command = add_command(
+        "apply", _apply, "Migrate the .starburst files", workers=True, migrate=True
+    )
+    apply_command.add_argument(
+        "--state",
+        help="Json file of the files already applied, skipped while they and their source are unchanged",
+    )
+    mirror_command = add_command(
+        "mirror",
+        _mirror,
+        "Migrate whole domains with all their products",
+        directory=False,
+        workers=True,
+        migrate=True,
+    )
+    mirror_command.add_argument("domains", nargs="+", help="Names of the domains")
+    rollback_command = add_command(
+        "rollback",
+        _rollback,
+        "Restore the destination entities recorded in rollback journals",
+        directory=False,
+        workers=True,
+    )
+    rollback_command.add_argument(
+        "journals", nargs="+", help="Rollback journals written by apply or mirror"
+    )
+    add_command(
+        "verify",
+        _verify,
+        "Compare the migrated entities of both instances",
+        workers=True,
+    )
+    bench_command = add_command(
+        "bench", _bench, "Measure the loading time of the .starburst files"
+    )
+    bench_command.add_argument(
+        "--repeat", type=int, default=5, help="Number of runs (default: 5)"
+    )
+    return parser
+
+
+def main(argv=None):
+    """
+    Runs the ``datamesh-migrate`` command.
+
+    Args:
+        argv (list): The command line arguments, ``sys.argv[1:]`` if None.
+
+    Returns:
+        int: The exit code, 0 on success and 1 if a file is invalid or a migration failed.
+    """
+    args = build_parser().parse_args(argv)
+    output = sys.stdout
+    with contextlib.ExitStack() as stack:
+        if args.format == "json":
+            # Keep stdout for the json result only
+            stack.enter_context(contextlib.redirect_stdout(sys.stderr))
+        args.profiler = None
+        if args.profile:
+            from datamesh_migration.profiling import MigrationProfiler
+
+            args.profiler = stack.enter_context(MigrationProfiler(args.profile))
+        result, ok = args.handler(args)
+
+    if args.format == "json":
+        json.dump(result, output, indent=2)
+        output.write("\n")
+    else:
+        _print_text(result, output)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
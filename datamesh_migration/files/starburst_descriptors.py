@@ -0,0 +1,288 @@
+"""
+Immutable descriptors built from the content of starburst migration files
+"""
+import hashlib
+
+from datamesh_migration.files.starburst_transformations import (
+    TransformationPipeline,
+)
+
+
+class _Descriptor:
+    """
+    Base class of the immutable, slotted descriptors.
+
+    Attributes are assigned once in ``__init__`` through ``object.__setattr__``; any later
+    assignment raises an AttributeError.
+    """
+
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        return (type(self), tuple(getattr(self, slot) for slot in self.__slots__))
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(
+            getattr(self, slot) == getattr(other, slot) for slot in self.__slots__
+        )
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, slot) for slot in self.__slots__))
+
+    def __repr__(self):
+        fields = ", ".join(
+            f"{slot}={getattr(self, slot)!r}" for slot in self.__slots__
+        )
+        return f"{type(self).__name__}({fields})"
+
+
+class DomainPair(_Descriptor):
+    """
+    Source and destination domain names of a migration.
+
+    Attributes:
+        src (str): The source domain name.
+        dest (str): The destination domain name.
+    """
+
+    __slots__ = ("src", "dest")
+
+    def __init__(self, src: str, dest: str):
+        object.__setattr__(self, "src", src)
+        object.__setattr__(self, "dest", dest)
+
+    @classmethod
+    def of(cls, domains):
+        """
+        Returns ``domains`` as a DomainPair.
+
+        Args:
+            domains (DomainPair | dict): A DomainPair or a dictionary with 'src' and 'dest' keys.
+
+        Returns:
+            DomainPair: The corresponding domain pair.
+        """
+        if isinstance(domains, cls):
+            return domains
+        return cls(domains.get("src"), domains.get("dest"))
+
+
+class DatasetSpec(_Descriptor):
+    """
+    A dataset listed in the 'datasets' field of a data product.
+
+    Attributes:
+        name (str): The name of the dataset.
+        type (str): The type of the dataset ('view' or 'materialized_view').
+        product_dest (str): The destination product name overriding the one of the product, or None.
+    """
+
+    __slots__ = ("name", "type", "product_dest")
+
+    def __init__(self, name: str, type: str, product_dest: str = None):
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "type", type)
+        object.__setattr__(self, "product_dest", product_dest)
+
+    @classmethod
+    def from_dict(cls, dataset: dict):
+        """
+        Builds a DatasetSpec from a validated dataset dictionary.
+
+        Args:
+            dataset (dict): A dictionary with 'name', 'type' and optionally 'productDestName' keys.
+
+        Returns:
+            DatasetSpec: The dataset descriptor.
+        """
+        return cls(
+            dataset.get("name"), dataset.get("type"), dataset.get("productDestName")
+        )
+
+
+class ProductSpec(_Descriptor):
+    """
+    A data product listed in the 'dataProducts' field of a starburst file.
+
+    Attributes:
+        src (str): The source product name.
+        dest (str): The destination product name, or None when the whole product is migrated.
+        datasets (tuple): The DatasetSpec to migrate, or None when no 'datasets' field is given.
+    """
+
+    __slots__ = ("src", "dest", "datasets")
+
+    def __init__(self, src: str, dest: str = None, datasets: tuple = None):
+        object.__setattr__(self, "src", src)
+        object.__setattr__(self, "dest", dest)
+        object.__setattr__(
+            self, "datasets", None if datasets is None else tuple(datasets)
+        )
+
+    @classmethod
+    def of(cls, products):
+        """
+        Returns ``products`` as a ProductSpec.
+
+        Args:
+            products (ProductSpec | dict): A ProductSpec or a dictionary with 'src' and 'dest' keys.
+
+        Returns:
+            ProductSpec: The corresponding product descriptor.
+        """
+        if isinstance(products, cls):
+            return products
+        return cls(products.get("src"), products.get("dest"))
+
+    @classmethod
+    def from_dict(cls, product: dict):
+        """
+        Builds a ProductSpec from a validated product dictionary.
+
+        Args:
+            product (dict): A dictionary with 'productSrcName' and optionally 'productDestName' and 'datasets' keys.
+
+        Returns:
+            ProductSpec: The product descriptor.
+        """
+        datasets = product.get("datasets")
+        return cls(
+            product.get("productSrcName"),
+            product.get("productDestName"),
+            None
+            if datasets is None
+            else tuple(DatasetSpec.from_dict(dataset) for dataset in datasets),
+        )
+
+
+class StarburstFile(_Descriptor):
+    """
+    The content of a valid starburst file.
+
+    Attributes:
+        domains (DomainPair): The source and destination domain names. When the file has no
+                              'domainNameDest', the destination is the source domain name.
+        products (tuple): The ProductSpec to migrate, or None when every product of the domain is migrated.
+        migrate_domain (bool): Whether the domain itself has to be migrated first.
+        source (str): The name of the file the descriptor has been loaded from, or None.
+        transform (TransformationPipeline): The transformations applied to the products, or None.
+    """
+
+    __slots__ = ("domains", "products", "migrate_domain", "source", "transform")
+
+    def __init__(
+        self,
+        domains: DomainPair,
+        products: tuple = None,
+        migrate_domain: bool = False,
+        source: str = None,
+        transform: TransformationPipeline = None,
+    ):
+        object.__setattr__(self, "domains", domains)
+        object.__setattr__(
+            self, "products", None if products is None else tuple(products)
+        )
+        object.__setattr__(self, "migrate_domain", migrate_domain)
+        object.__setattr__(self, "source", source)
+        object.__setattr__(self, "transform", transform)
+
+    @property
+    def label(self):
+        """str: The file name, or the domain pair when the descriptor has no source file."""
+        return self.source or f"{self.domains.src} -> {self.domains.dest}"
+
+    def fingerprint(self):
+        """
+        Computes a fingerprint of the migration described by the file, regardless of its name.
+
+        Returns:
+            str: The sha256 hex digest of the descriptor content.
+        """
+        content = repr(
+            (self.domains, self.products, self.migrate_domain, self.transform)
+        )
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def from_dict(cls, content: dict, source: str = None):
+        """
+        Builds a StarburstFile from the validated content of a starburst file.
+
+        Args:
+            content (dict): The content of a starburst file, validated by ``is_valid_domain_conf``.
+            source (str): The name of the file.
+
+        Returns:
+            StarburstFile: The file descriptor.
+        """
+        products = content.get("dataProducts")
+        transformations = content.get("transformations")
+        return cls(
+            domains=DomainPair(
+                content.get("domainNameSrc"),
+                content.get("domainNameDest", content.get("domainNameSrc")),
+            ),
+            products=None
+            if products is None
+            else tuple(ProductSpec.from_dict(product) for product in products),
+            migrate_domain="domainNameDest" not in content,
+            source=source,
+            transform=TransformationPipeline(transformations)
+            if transformations
+            else None,
+        )
+
+
+def group_by_destination(starburst_files):
+    """
+    Groups starburst files by destination domain, keeping their order inside each group.
+
+    Files of different groups never write the same destination entity, so groups can be
+    migrated concurrently.
+
+    Args:
+        starburst_files (list): The StarburstFile descriptors to group.
+
+    Returns:
+        list: The lists of StarburstFile sharing the same destination domain.
+    """
+    groups = {}
+    for file in starburst_files:
+        groups.setdefault(file.domains.dest, []).append(file)
+    return list(groups.values())
+
+
+def partition_shards(starburst_files, shards: int):
+    """
+    Splits starburst files into shards of whole destination domains with balanced workloads.
+
+    The weight of a file is its number of products, or 1 when it migrates a whole domain.
+    Groups are assigned from the heaviest to the lightest shard.
+
+    Args:
+        starburst_files (list): The StarburstFile descriptors to split.
+        shards (int): The number of shards.
+
+    Returns:
+        list: The non empty lists of StarburstFile of each shard.
+    """
+
+    def weight(files):
+        return sum(len(file.products) if file.products else 1 for file in files)
+
+    partition = [[] for _ in range(shards)]
+    loads = [0] * shards
+    groups = sorted(group_by_destination(starburst_files), key=weight, reverse=True)
+    for files in groups:
+        lightest = loads.index(min(loads))
+        partition[lightest].extend(files)
+        loads[lightest] += weight(files)
+    return [files for files in partition if files]
@@ -4,6 +4,18 @@ Utilities to handle starburst migration files
 import os
 import json
 import yaml
+from datamesh_migration.files.starburst_descriptors import StarburstFile
+from datamesh_migration.null_profiler import NULL_PROFILER
+from datamesh_migration.files.starburst_transformations import (
+    validate_transformations,
+)
+
+VALID_TOP_LEVEL_KEYS = {
+    "domainNameSrc",
+    "domainNameDest",
+    "dataProducts",
+    "transformations",
+}
 
 
 def validate_top_level_keys(data):
@@ -16,8 +28,7 @@ def validate_top_level_keys(data):
     Returns:
         bool: True if all top-level keys in the input are valid, False otherwise.
     """
-    valid_keys = {"domainNameSrc", "domainNameDest", "dataProducts"}
-    return set(data.keys()).issubset(valid_keys)
+    return set(data.keys()).issubset(VALID_TOP_LEVEL_KEYS)
 
 
 def validate_domain_names(data):
@@ -155,7 +166,7 @@ def is_valid_domain_conf(data):
     if not validate_top_level_keys(data):
         print(
             "Invalid fields: ",
-            set(data.keys()) - {"domainNameSrc", "domainNameDest", "dataProducts"},
+            set(data.keys()) - VALID_TOP_LEVEL_KEYS,
         )
         return False
 
@@ -165,10 +176,76 @@ def is_valid_domain_conf(data):
     if not validate_data_products(data):
         return False
 
+    if "transformations" in data and not validate_transformations(
+        data["transformations"]
+    ):
+        return False
+
     return True
 
 
-def read_starburst_files(directory: str):
+def read_sidecar_transformations(filepath: str):
+    """
+    Reads the transformations sidecar of a starburst file, if any.
+
+    The sidecar has the name of the starburst file with the .transformations extension
+    (yaml or json) and holds the content of the 'transformations' field.
+
+    Args:
+        filepath (str): The path of the starburst file.
+
+    Returns:
+        The content of the sidecar, or None if there is no sidecar.
+    """
+    sidecar_path = f"{os.path.splitext(filepath)[0]}.transformations"
+    if not os.path.exists(sidecar_path):
+        return None
+    with open(sidecar_path, "r") as file:
+        # Json is a subset of yaml
+        return yaml.safe_load(file)
+
+
+def load_starburst_file(filepath: str):
+    """
+    Loads the content of a starburst file, in yaml or json format, with its sidecar transformations.
+
+    Args:
+        filepath (str): The path of the starburst file.
+
+    Returns:
+        tuple: (True, content) if the file has been read, (False, None) otherwise.
+    """
+    filename = os.path.basename(filepath)
+    with open(filepath, "r") as file:
+        try:
+            content = yaml.safe_load(file)
+        except yaml.YAMLError as yaml_err:
+            print(f"{filename} is not yaml format: {yaml_err}")
+            print("Checking json formating")
+            file.seek(0)
+            try:
+                content = json.load(file)
+            except json.JSONDecodeError as json_err:
+                print(f"{filename} is not json format: {json_err}")
+                return False, None
+
+    if isinstance(content, dict):
+        try:
+            sidecar = read_sidecar_transformations(filepath)
+        except yaml.YAMLError as sidecar_err:
+            print(f"Transformations of {filename} are invalid: {sidecar_err}")
+            print(f"{filename} is invalid")
+            return False, None
+        if sidecar is not None:
+            if "transformations" in content:
+                print(f"{filename} has transformations in the file and in a sidecar")
+                print(f"{filename} is invalid")
+                return False, None
+            content["transformations"] = sidecar
+    return True, content
+
+
+def read_starburst_files(directory: str, as_class: bool = False, profiler=None):
     """
     Reads all files with the .starburst extension in a given directory.
     Validates the content of each file according to specified criteria:
@@ -178,34 +255,36 @@ def read_starburst_files(directory: str):
     - If 'Datasets' is present in a product, it must contain at least one dataset with 'name' and 'type'.
     - The file must not contain any invalid fields.
     - The file must not contain more than one domain.
+    - The transformations, in the file or in its .transformations sidecar, must be valid.
 
     Args:
     directory (str): The path to the directory containing .starburst files.
+    as_class (bool): If True, each valid content is returned as an immutable StarburstFile.
+    profiler (MigrationProfiler): Profiles the 'load' and 'validate' phases. No profiling if None.
 
     Returns:
-    list: A list of dictionaries representing the valid contents of the .starburst files.
+    list: A list of dictionaries (or StarburstFile if as_class) representing the valid contents of the .starburst files.
     """
+    profiler = profiler or NULL_PROFILER
     valid_files_content = []
     for filename in os.listdir(directory):
         if filename.endswith(".starburst"):
             print(f"Scanning {filename}")
-            filepath = os.path.join(directory, filename)
-            with open(filepath, "r") as file:
-                try:
-                    content = yaml.safe_load(file)
-                except yaml.YAMLError as yaml_err:
-                    print(f"{filename} is not yaml format: {yaml_err}")
-                    print("Checking json formating")
-                    file.seek(0)
-                    try:
-                        content = json.load(file)
-                    except json.JSONDecodeError as json_err:
-                        print(f"{filename} is not json format: {json_err}")
-                        continue
-                print(f"Checking validity of {filename}")
-                if isinstance(content, dict) and is_valid_domain_conf(content):
-                    print(f"{filename} is valid")
-                    valid_files_content.append(content)
-                else:
-                    print(f"{filename} is invalid")
+            with profiler.phase("load"):
+                readable, content = load_starburst_file(
+                    os.path.join(directory, filename)
+                )
+            if not readable:
+                continue
+            print(f"Checking validity of {filename}")
+            with profiler.phase("validate"):
+                valid = isinstance(content, dict) and is_valid_domain_conf(content)
+            if valid:
+                print(f"{filename} is valid")
+                if as_class:
+                    with profiler.phase("load"):
+                        content = StarburstFile.from_dict(content, source=filename)
+                valid_files_content.append(content)
+            else:
+                print(f"{filename} is invalid")
     return valid_files_content
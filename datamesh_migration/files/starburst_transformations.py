@@ -0,0 +1,235 @@
+"""
+Declarative transformations applied to data products before they are written to the destination
+"""
+import json
+import re
+
+TRANSFORMATION_KEYS = {"catalogs", "schemas", "replace", "owners", "tags"}
+
+# Attribute holding the sql of views and materialized views
+DEFINITION_FIELD = "definition_query"
+
+# Dotted names of 2 or 3 parts (schema.table or catalog.schema.table), quoted or not.
+# String literals and lone quoted identifiers are matched too, to be skipped as a whole.
+# No match spans a NUL character: the queries joined by _SEPARATOR are renamed independently.
+_IDENTIFIER = r'(?:"[^"\x00]+"|[A-Za-z_][\w$]*)'
+_QUALIFIED_NAME = re.compile(
+    r"'(?:[^'\x00]|'')*'"
+    rf'|(?P<name>(?<![\w".]){_IDENTIFIER}(?:\s*\.\s*{_IDENTIFIER}){{1,2}}(?![\w".]))'
+    r'|"[^"\x00]*"'
+)
+_NAME_PART = re.compile(rf"{_IDENTIFIER}|\s*\.\s*")
+
+# Joins the sql of all datasets of a product, so the renames run once per product
+_SEPARATOR = "\n\x00\n"
+
+
+def validate_transformations(transformations):
+    """
+    Validates the 'transformations' field of a starburst file.
+
+    Args:
+        transformations (dict): The transformations to validate.
+
+    Returns:
+        bool: True if the transformations are valid, False otherwise.
+    """
+    if not isinstance(transformations, dict):
+        print("Field 'transformations' must be a mapping")
+        return False
+    if not set(transformations.keys()).issubset(TRANSFORMATION_KEYS):
+        print(
+            "Invalid transformations: ",
+            set(transformations.keys()) - TRANSFORMATION_KEYS,
+        )
+        return False
+    for key in ("catalogs", "schemas"):
+        renames = transformations.get(key, {})
+        if not isinstance(renames, dict) or not all(
+            isinstance(name, str) and isinstance(new_name, str) and new_name.strip()
+            for name, new_name in renames.items()
+        ):
+            print(f"Transformation '{key}' must map names to non-empty names")
+            return False
+    replacements = transformations.get("replace", [])
+    if not isinstance(replacements, list):
+        print("Transformation 'replace' must be a list")
+        return False
+    for replacement in replacements:
+        if not isinstance(replacement, dict) or set(replacement.keys()) != {
+            "pattern",
+            "replacement",
+        }:
+            print("Each 'replace' transformation needs a 'pattern' and a 'replacement'")
+            return False
+        try:
+            pattern = re.compile(replacement["pattern"])
+        except (re.error, TypeError) as err:
+            print(f"Invalid 'replace' pattern {replacement['pattern']!r}: {err}")
+            return False
+        if not isinstance(replacement["replacement"], str):
+            print("Each 'replace' replacement must be a string")
+            return False
+        try:
+            # The template is compiled without a match too, checking group references
+            pattern.sub(replacement["replacement"], "")
+        except (re.error, IndexError) as err:
+            print(
+                f"Invalid 'replace' replacement {replacement['replacement']!r}: {err}"
+            )
+            return False
+    for key in ("owners", "tags"):
+        if key in transformations and not isinstance(transformations[key], list):
+            print(f"Transformation '{key}' must be a list")
+            return False
+    return True
+
+
+class TransformationPipeline:
+    """
+    Compiled transformations of the products and datasets of a starburst file.
+
+    The transformations are configured under the 'transformations' field of the file:
+
+    - catalogs: renames catalogs in the sql of the datasets and in the catalog of the products.
+    - schemas: renames schemas in the sql of the datasets.
+    - replace: list of regex 'pattern' and 'replacement' applied to the sql of each dataset.
+    - owners: replaces the owners of the products.
+    - tags: replaces the tags of the products.
+
+    Catalogs are renamed in 3 parts names (catalog.schema.table), schemas in 2 and 3 parts names.
+    Names inside string literals are left untouched. Every 2 parts name is taken as schema.table:
+    a column qualified by a table alias named like a renamed schema (``s.col`` when schema ``s``
+    is renamed) is renamed as well, so avoid such aliases or rename with a 'replace' pattern.
+
+    Attributes:
+        config (dict): The transformations as configured.
+    """
+
+    __slots__ = ("config", "_catalogs", "_schemas", "_replacements")
+
+    def __init__(self, config: dict):
+        """
+        Args:
+            config (dict): The transformations, validated by ``validate_transformations``.
+        """
+        self.config = config
+        self._catalogs = {
+            _normalize_name(name): new_name
+            for name, new_name in config.get("catalogs", {}).items()
+        }
+        self._schemas = {
+            _normalize_name(name): new_name
+            for name, new_name in config.get("schemas", {}).items()
+        }
+        self._replacements = [
+            (re.compile(replacement["pattern"]), replacement["replacement"])
+            for replacement in config.get("replace", [])
+        ]
+
+    def __repr__(self):
+        return f"TransformationPipeline({json.dumps(self.config, sort_keys=True)})"
+
+    def __reduce__(self):
+        return (type(self), (self.config,))
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.config == other.config
+
+    def __hash__(self):
+        return hash(json.dumps(self.config, sort_keys=True))
+
+    def transform_product(self, product):
+        """
+        Transforms a data product and all its datasets in place.
+
+        Args:
+            product: The data product to transform.
+
+        Returns:
+            The transformed data product.
+        """
+        catalog_name = getattr(product, "catalog_name", None)
+        if catalog_name:
+            product.catalog_name = self._catalogs.get(
+                _normalize_name(catalog_name), catalog_name
+            )
+        if "owners" in self.config:
+            product.owners = list(self.config["owners"])
+        if "tags" in self.config:
+            product.tags = list(self.config["tags"])
+        self.transform_datasets(
+            list(product.views or []) + list(product.materialized_views or [])
+        )
+        return product
+
+    def transform_datasets(self, datasets):
+        """
+        Rewrites the sql of datasets in place, the names of all of them at once.
+
+        Args:
+            datasets (list): The views and materialized views to transform.
+
+        Returns:
+            list: The transformed datasets.
+        """
+        datasets = [
+            dataset
+            for dataset in datasets
+            if isinstance(getattr(dataset, DEFINITION_FIELD, None), str)
+        ]
+        queries = self.rewrite_sql(
+            [getattr(dataset, DEFINITION_FIELD) for dataset in datasets]
+        )
+        for dataset, query in zip(datasets, queries):
+            setattr(dataset, DEFINITION_FIELD, query)
+        return datasets
+
+    def rewrite_sql(self, queries):
+        """
+        Applies the sql transformations to a list of queries.
+
+        Args:
+            queries (list): The sql queries.
+
+        Returns:
+            list: The rewritten queries, in the same order.
+        """
+        if not queries or not (
+            self._catalogs or self._schemas or self._replacements
+        ):
+            return list(queries)
+
+        queries = list(queries)
+        if self._catalogs or self._schemas:
+            queries = _QUALIFIED_NAME.sub(
+                self._rename, _SEPARATOR.join(queries)
+            ).split(_SEPARATOR)
+        # Patterns may be anchored or look around, they are applied to each query
+        for pattern, replacement in self._replacements:
+            queries = [pattern.sub(replacement, query) for query in queries]
+        return queries
+
+    def _rename(self, match):
+        if match.group("name") is None:
+            # String literal or lone quoted identifier
+            return match.group(0)
+        parts = _NAME_PART.findall(match.group(0))
+        names = parts[::2]
+        if len(names) == 3:
+            renames = (self._catalogs, self._schemas)
+        else:
+            renames = (self._schemas,)
+        for index, mapping in enumerate(renames):
+            new_name = mapping.get(_normalize_name(names[index]))
+            if new_name is not None:
+                quoted = names[index].startswith('"')
+                parts[index * 2] = f'"{new_name}"' if quoted else new_name
+        return "".join(parts)
+
+
+def _normalize_name(name: str):
+    """Lower cases an identifier and removes its quotes, as trino resolves them."""
+    return name.strip('"').lower()
@@ -1,12 +1,41 @@
 """
 Class to migrate data products entity from instance of starburst to another one
 """
+import contextlib
+import copy
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from starburst_api.classes.class_starburst_connection_info import (
     StarburstConnectionInfo,
 )
 from starburst_api.classes.class_starburst import Starburst
 from datamesh_migration.migrators.dataset_migrant import DatasetMigrant
+from datamesh_migration.migrators.deadline import Deadline, MigrationTimeout
+from datamesh_migration.migrators.migration_report import (
+    MigrationReport,
+    MigrationState,
+)
+from datamesh_migration.migrators.rollback import RollbackJournal, read_journal
+from datamesh_migration.migrators.single_flight import SingleFlight
+from datamesh_migration.null_profiler import NULL_PROFILER
+from datamesh_migration.migrators.verification import DatameshVerifier, content_hash
 from datamesh_migration.files.starburst_files import read_starburst_files
+from datamesh_migration.files.starburst_transformations import (
+    TransformationPipeline,
+)
+from datamesh_migration.files.starburst_descriptors import (
+    DatasetSpec,
+    DomainPair,
+    ProductSpec,
+    StarburstFile,
+    group_by_destination,
+    partition_shards,
+)
+
+# Outcome of a file already applied according to the migration state
+_SKIPPED = "skipped"
 
 
 class DatameshMigrator:
@@ -16,12 +45,137 @@ class DatameshMigrator:
         self,
         connection_info_src: StarburstConnectionInfo,
         connection_info_dest: StarburstConnectionInfo,
+        rollback_path: str = None,
+        coalesce_lookups: bool = True,
+        profiler=None,
+        deadline: Deadline = None,
     ):
+        """
+        Args:
+            connection_info_src (StarburstConnectionInfo): The connection info of the source instance.
+            connection_info_dest (StarburstConnectionInfo): The connection info of the destination instance.
+            rollback_path (str): The path of a rollback journal recording the state of every destination
+                                 entity before it is overwritten or created. No journal if None.
+            coalesce_lookups (bool): If True, concurrent lookups of the same domain or product share
+                                     a single request.
+            profiler (MigrationProfiler): Profiles the 'load', 'validate', 'fetch', 'transform' and 'write'
+                                          phases of the migrations. No profiling if None.
+            deadline (Deadline): The deadline, call timeout and phase budgets of the migrations.
+                                 Files not migrated in time are reported as pending. No limit if None.
+        """
         # Creating client for source instance and destination instance
         self.starburst_client_src = Starburst(connection_info_src)
         self.starburst_client_dest = Starburst(connection_info_dest)
+        self.rollback_journal = (
+            RollbackJournal(rollback_path) if rollback_path else None
+        )
+        self.single_flight = SingleFlight() if coalesce_lookups else None
+        self.profiler = profiler or NULL_PROFILER
+        self.deadline = deadline
+        # Source entities fetched for the migration state, per thread migrating a file
+        self._prefetched = threading.local()
+
+    def _run(self, phase: str, function, timed: bool = True):
+        """Runs a call of a phase, profiled and bounded by the deadline, if any."""
+
+        def call():
+            # Profiled in the thread running the call, which is not this one for timed calls
+            with self.profiler.phase(phase):
+                return function()
 
-    def migrate_dataset(self, migrant: DatasetMigrant):
+        if self.deadline is None:
+            return call()
+        return self.deadline.run(phase, call, timed)
+
+    def _lookup(self, key, function):
+        """
+        Runs a lookup through the single flight layer, if enabled.
+
+        A source entity prefetched for the file migrated by this thread is not requested again,
+        a copy is returned as the migration modifies the entities it gets.
+        """
+        entities = getattr(self._prefetched, "entities", None)
+        if entities is not None and key in entities:
+            return copy.deepcopy(entities[key])
+        if self.single_flight is None:
+            result = self._run("fetch", function)
+        else:
+            result = self.single_flight.do(key, lambda: self._run("fetch", function))
+        if getattr(self._prefetched, "recording", False):
+            entities[key] = copy.deepcopy(result)
+        return result
+
+    def _write(self, method: str, *args, **kwargs):
+        """
+        Calls a write method of the destination client.
+
+        The deadline is checked before the write starts, a started write is never interrupted.
+
+        Args:
+            method (str): The name of the method, like 'update_data_product'.
+            *args: The positional arguments of the method.
+            **kwargs: The keyword arguments of the method.
+
+        Returns:
+            The result of the method.
+        """
+        return self._run(
+            "write",
+            lambda: getattr(self.starburst_client_dest, method)(*args, **kwargs),
+            timed=False,
+        )
+
+    def _get_domain(self, client, domain_name: str):
+        """
+        Gets a domain by name, sharing the request with concurrent lookups of the same domain.
+
+        Args:
+            client (Starburst): The client of the instance to query.
+            domain_name (str): The name of the domain.
+
+        Returns:
+            The domain, or a falsy value if not found.
+        """
+        return self._lookup(
+            (id(client), "domain", domain_name),
+            lambda: client.get_domain_by_name(domain_name=domain_name, as_class=True),
+        )
+
+    def _get_data_product(self, client, domain_name: str, product_name: str):
+        """
+        Gets a data product, sharing the request with concurrent lookups of the same product.
+
+        Args:
+            client (Starburst): The client of the instance to query.
+            domain_name (str): The name of the domain of the product.
+            product_name (str): The name of the product.
+
+        Returns:
+            The data product, or a falsy value if not found.
+        """
+        return self._lookup(
+            (id(client), "product", domain_name, product_name),
+            lambda: client.get_data_product(
+                domain_name=domain_name, data_product_name=product_name, as_class=True
+            ),
+        )
+
+    def _capture(self, kind: str, domain_name: str, name: str, entity=None):
+        """
+        Records the state of a destination entity in the rollback journal, if any.
+
+        Args:
+            kind (str): The kind of the entity ('domain' or 'product').
+            domain_name (str): The name of the domain of the entity.
+            name (str): The name of the entity.
+            entity: The current entity, or None if it is about to be created.
+        """
+        if self.rollback_journal is not None:
+            self.rollback_journal.capture(kind, domain_name, name, entity)
+
+    def migrate_dataset(
+        self, migrant: DatasetMigrant, transform: TransformationPipeline = None
+    ):
         """
         Migrates a dataset from a source domain to a destination domain.
 
@@ -34,90 +188,132 @@ class DatameshMigrator:
             migrant (DatasetMigrant): An object containing information about the dataset migration,
                                       including the source and destination domains and products,
                                       as well as the dataset name and type.
+            transform (TransformationPipeline): The transformations applied before the write, or None.
 
         Returns:
-            None
+            bool: True if the dataset has been migrated, False otherwise.
+
+        """
+        return self.migrate_datasets(
+            DomainPair(migrant.domain_src, migrant.domain_dest),
+            ProductSpec(migrant.product_src, migrant.product_dest),
+            [DatasetSpec(migrant.name, migrant.type)],
+            transform,
+        )
+
+    def migrate_datasets(
+        self, domains, products, datasets, transform: TransformationPipeline = None
+    ):
+        """
+        Migrates datasets from a source data product to a destination data product.
+
+        The domains and both products are fetched once, and the destination product is written
+        once, whatever the number of datasets. Datasets already in the destination product are
+        overwritten. The datasets found at the source are migrated even if others are missing.
+
+        Args:
+            domains (DomainPair | dict): The source and destination domain names.
+                            Example: {'src': 'source_domain_name', 'dest': 'destination_domain_name'}
+            products (ProductSpec | dict): The source and destination product names.
+                            Example: {'src': 'source_product_name', 'dest': 'destination_product_name'}
+            datasets (list): The DatasetSpec of the datasets to migrate.
+            transform (TransformationPipeline): The transformations applied before the write, or None.
 
+        Returns:
+            bool: True if every dataset has been migrated, False otherwise.
         """
+        domains = DomainPair.of(domains)
+        products = ProductSpec.of(products)
+        datasets = list(dict.fromkeys(datasets))
+
         # Checking if domain source and domain destination exist
         print(
-            f"Checking if domain {migrant.domain_src} exists at source instance({self.starburst_client_src.connection_info.host})"
-        )
-        domain_src = self.starburst_client_src.get_domain_by_name(
-            domain_name=migrant.domain_src, as_class=True
+            f"Checking if domain {domains.src} exists at source instance({self.starburst_client_src.connection_info.host})"
         )
+        domain_src = self._get_domain(self.starburst_client_src, domains.src)
         if not domain_src:
-            return
+            return False
 
-        print(f"Domain {migrant.domain_src} exists")
+        print(f"Domain {domains.src} exists")
 
         print(
-            f"Checking if domain {migrant.domain_dest} exists at destination instance({self.starburst_client_dest.connection_info.host})"
-        )
-        domain_dest = self.starburst_client_dest.get_domain_by_name(
-            domain_name=migrant.domain_dest, as_class=True
+            f"Checking if domain {domains.dest} exists at destination instance({self.starburst_client_dest.connection_info.host})"
         )
+        domain_dest = self._get_domain(self.starburst_client_dest, domains.dest)
         if not domain_dest:
-            return
+            return False
 
-        print(f"Domain {migrant.domain_dest} exists...")
+        print(f"Domain {domains.dest} exists...")
 
         del domain_src
         del domain_dest
 
         # Checking if product source and product destination exist
         print(
-            f"Checking if domain {migrant.domain_src} has product {migrant.product_src} at source instance({self.starburst_client_src.connection_info.host})"
+            f"Checking if domain {domains.src} has product {products.src} at source instance({self.starburst_client_src.connection_info.host})"
         )
-        product_src = self.starburst_client_src.get_data_product(
-            domain_name=migrant.domain_src,
-            data_product_name=migrant.product_src,
-            as_class=True,
+        product_src = self._get_data_product(
+            self.starburst_client_src, domains.src, products.src
         )
         if not product_src:
-            return
+            return False
 
-        print(f"Domain {migrant.domain_src} has product {migrant.product_src}...")
+        print(f"Domain {domains.src} has product {products.src}...")
 
-        # Checking if product source and product destination exist
         print(
-            f"Checking if domain {migrant.domain_src} has product {migrant.product_src} at destination instance({self.starburst_client_dest.connection_info.host})"
+            f"Checking if domain {domains.dest} has product {products.dest} at destination instance({self.starburst_client_dest.connection_info.host})"
         )
-        product_dest = self.starburst_client_dest.get_data_product(
-            domain_name=migrant.domain_dest,
-            data_product_name=migrant.product_dest,
-            as_class=True,
+        product_dest = self._get_data_product(
+            self.starburst_client_dest, domains.dest, products.dest
         )
         if not product_dest:
-            return
-
-        print(f"Domain {migrant.domain_src} has product {migrant.product_src}...")
-
-        # Checking if dataset exists at source
-        print(f"Checking if dataset {migrant.name} exists")
-        found = False
-        for dataset in getattr(product_src, f"{migrant.type}s"):
-            # Overwrite dataset if already exists at destination
-            if dataset.name == migrant.name:
-                print(f"Dataset {migrant.name} exists, it will be update...")
-                setattr(
-                    product_dest,
-                    f"{migrant.type}s",
-                    [
-                        dts
-                        for dts in getattr(product_dest, f"{migrant.type}s")
-                        if dts.name != migrant.name
-                    ]
-                    + [dataset],
-                )
-                self.starburst_client_dest.update_data_product(product_dest)
-                found = True
-                break
+            return False
+
+        print(f"Domain {domains.dest} has product {products.dest}...")
+
+        # Checking if datasets exist at source
+        found = {}
+        for spec in datasets:
+            print(f"Checking if dataset {spec.name} exists")
+            field = f"{spec.type}s"
+            dataset = next(
+                (dts for dts in getattr(product_src, field) if dts.name == spec.name),
+                None,
+            )
+            if dataset is None:
+                print(f"Dataset {spec.name} not found")
+                continue
+            print(f"Dataset {spec.name} exists, it will be update...")
+            found.setdefault(field, []).append(dataset)
 
         if not found:
-            print(f"Dataset {migrant.name} not found")
+            return False
+
+        if transform is not None:
+            self._run(
+                "transform",
+                lambda: transform.transform_datasets(
+                    [dataset for datasets in found.values() for dataset in datasets]
+                ),
+                timed=False,
+            )
+
+        # Overwrite datasets if already exist at destination
+        self._capture("product", domains.dest, products.dest, product_dest)
+        for field, field_datasets in found.items():
+            names = {dataset.name for dataset in field_datasets}
+            setattr(
+                product_dest,
+                field,
+                [dts for dts in getattr(product_dest, field) if dts.name not in names]
+                + field_datasets,
+            )
+        migrated = self._write("update_data_product", product_dest) == 200
+        return migrated and sum(map(len, found.values())) == len(datasets)
 
-    def migrate_product(self, domains: dict, product: str):
+    def migrate_product(
+        self, domains, product: str, transform: TransformationPipeline = None
+    ):
         """
         Migrates a data product from a source domain to a destination domain.
 
@@ -127,73 +323,76 @@ class DatameshMigrator:
         in the destination domain, it will be overwritten.
 
         Args:
-            domains (dict): A dictionary containing the source and destination domain names.
+            domains (DomainPair | dict): The source and destination domain names.
                             Example: {'src': 'source_domain_name', 'dest': 'destination_domain_name'}
             product (str): The name of the product to be migrated.
+            transform (TransformationPipeline): The transformations applied before the write, or None.
 
         Returns:
-            None
+            bool: True if the product has been migrated, False otherwise.
         """
+        domains = DomainPair.of(domains)
+
         # Checking if domain source and domain destination exist
         print(
-            f"Checking if domain {domains.get('src')} exists at source instance({self.starburst_client_src.connection_info.host})"
-        )
-        domain_src = self.starburst_client_src.get_domain_by_name(
-            domain_name=domains.get("src"), as_class=True
+            f"Checking if domain {domains.src} exists at source instance({self.starburst_client_src.connection_info.host})"
         )
+        domain_src = self._get_domain(self.starburst_client_src, domains.src)
         if not domain_src:
-            return
+            return False
 
-        print(f"Domain {domains.get('src')} exists...")
+        print(f"Domain {domains.src} exists...")
 
         print(
-            f"Checking if domain {domains.get('dest')} exists at destination instance({self.starburst_client_dest.connection_info.host})"
-        )
-        domain_dest = self.starburst_client_dest.get_domain_by_name(
-            domain_name=domains.get("dest"), as_class=True
+            f"Checking if domain {domains.dest} exists at destination instance({self.starburst_client_dest.connection_info.host})"
         )
+        domain_dest = self._get_domain(self.starburst_client_dest, domains.dest)
         if not domain_dest:
-            return
+            return False
 
-        print(f"Domain {domains.get('dest')} exists...")
+        print(f"Domain {domains.dest} exists...")
 
         del domain_src
 
         # Checking if product exists at source and destination
         print(
-            f"Checking if domain {domains.get('src')} has product {product} at source instance({self.starburst_client_src.connection_info.host})"
+            f"Checking if domain {domains.src} has product {product} at source instance({self.starburst_client_src.connection_info.host})"
         )
-        product_src = self.starburst_client_src.get_data_product(
-            domain_name=domains.get("src"),
-            data_product_name=product,
-            as_class=True,
+        product_src = self._get_data_product(
+            self.starburst_client_src, domains.src, product
         )
         if not product_src:
-            return
-
-        print(f"Domain {domains.get('src')} has product {product}...")
+            return False
+
+        print(f"Domain {domains.src} has product {product}...")
+        if transform is not None:
+            self._run(
+                "transform",
+                lambda: transform.transform_product(product_src),
+                timed=False,
+            )
 
         print(
-            f"Checking if domain {domains.get('dest')} has product {product} at destination instance({self.starburst_client_dest.connection_info.host})"
+            f"Checking if domain {domains.dest} has product {product} at destination instance({self.starburst_client_dest.connection_info.host})"
         )
-        product_dest = self.starburst_client_dest.get_data_product(
-            domain_name=domains.get("dest"),
-            data_product_name=product,
-            as_class=True,
+        product_dest = self._get_data_product(
+            self.starburst_client_dest, domains.dest, product
         )
         if product_dest:
-            print(f"Domain {domains.get('dest')} has product {product} ...")
+            print(f"Domain {domains.dest} has product {product} ...")
             print("Existing datasets will be overwritten")
+            self._capture("product", domains.dest, product, product_dest)
             product_src.catalog_name = product_dest.catalog_name
             product_src.data_domain_id = product_dest.data_domain_id
             product_src.id = product_dest.id
 
-            self.starburst_client_dest.update_data_product(product_src)
-        else:
-            print(f"Domain {domains.get('dest')} has not product {product} ...")
-            print(f"Product {product} would be create")
-            product_src.data_domain_id = domain_dest.id
-            self.starburst_client_dest.create_data_product(product_src)
+            return self._write("update_data_product", product_src) == 200
+
+        print(f"Domain {domains.dest} has not product {product} ...")
+        print(f"Product {product} would be create")
+        product_src.data_domain_id = domain_dest.id
+        self._capture("product", domains.dest, product)
+        return self._write("create_data_product", product_src) == 200
 
     def migrate_domain(self, domain_name: str):
         """
@@ -204,17 +403,18 @@ class DatameshMigrator:
 
         Args:
             domain_name (str): The name of the domain to be migrated.
+
+        Returns:
+            bool: True if the domain has been migrated, False otherwise.
         """
         # Check if domain exists at the source instance
         print(
             f"Checking if domain {domain_name} exists at source instance ({self.starburst_client_src.connection_info.host})"
         )
-        domain_src = self.starburst_client_src.get_domain_by_name(
-            domain_name=domain_name, as_class=True
-        )
+        domain_src = self._get_domain(self.starburst_client_src, domain_name)
         if not domain_src:
             print(f"Domain {domain_name} does not exist at the source instance.")
-            return
+            return False
 
         print("Domain exists at source instance.")
 
@@ -222,25 +422,27 @@ class DatameshMigrator:
         print(
             f"Checking if domain {domain_name} exists at destination instance ({self.starburst_client_dest.connection_info.host})"
         )
-        domain_dest = self.starburst_client_dest.get_domain_by_name(
-            domain_name=domain_name, as_class=True
-        )
+        domain_dest = self._get_domain(self.starburst_client_dest, domain_name)
 
         if not domain_dest:
             # Create the domain at the destination if it does not exist
             print(
                 f"Domain {domain_name} does not exist at the destination instance. Creating domain."
             )
-            self.starburst_client_dest.create_domain(domain=domain_src)
-        else:
-            # Update the domain at the destination if it exists
-            print(
-                f"Domain {domain_name} exists at the destination instance. Updating domain."
-            )
-            domain_src.id = domain_dest.id
-            self.starburst_client_dest.update_domain(domain=domain_src)
+            self._capture("domain", domain_name, domain_name)
+            return self._write("create_domain", domain=domain_src) == 200
 
-    def migrate_all_product_datasets(self, domains: dict, products: dict):
+        # Update the domain at the destination if it exists
+        print(
+            f"Domain {domain_name} exists at the destination instance. Updating domain."
+        )
+        self._capture("domain", domain_name, domain_name, domain_dest)
+        domain_src.id = domain_dest.id
+        return self._write("update_domain", domain=domain_src) == 200
+
+    def migrate_all_product_datasets(
+        self, domains, products, transform: TransformationPipeline = None
+    ):
         """
         Migrates all datasets from a source data product to a destination data product within specified domains.
 
@@ -250,68 +452,73 @@ class DatameshMigrator:
         If datasets with the same names exist in the destination product, they will be overwritten.
 
         Args:
-            domains (dict): A dictionary containing the source and destination domain names.
+            domains (DomainPair | dict): The source and destination domain names.
                             Example: {'src': 'source_domain_name', 'dest': 'destination_domain_name'}
-            products (dict): A dictionary containing the source and destination product names.
+            products (ProductSpec | dict): The source and destination product names.
                             Example: {'src': 'source_product_name', 'dest': 'destination_product_name'}
+            transform (TransformationPipeline): The transformations applied before the write, or None.
 
         Returns:
-            None
+            bool: True if the datasets have been migrated, False otherwise.
         """
+        domains = DomainPair.of(domains)
+        products = ProductSpec.of(products)
+
         # Checking if domain source and domain destination exist
         print(
-            f"Checking if domain {domains.get('src')} exists at source instance({self.starburst_client_src.connection_info.host})"
-        )
-        domain_src = self.starburst_client_src.get_domain_by_name(
-            domain_name=domains.get("src"), as_class=True
+            f"Checking if domain {domains.src} exists at source instance({self.starburst_client_src.connection_info.host})"
         )
+        domain_src = self._get_domain(self.starburst_client_src, domains.src)
         if not domain_src:
-            return
+            return False
 
-        print(f"Domain {domains.get('src')} exists...")
+        print(f"Domain {domains.src} exists...")
 
         print(
-            f"Checking if domain {domains.get('dest')} exists at destination instance({self.starburst_client_dest.connection_info.host})"
-        )
-        domain_dest = self.starburst_client_dest.get_domain_by_name(
-            domain_name=domains.get("dest"), as_class=True
+            f"Checking if domain {domains.dest} exists at destination instance({self.starburst_client_dest.connection_info.host})"
         )
+        domain_dest = self._get_domain(self.starburst_client_dest, domains.dest)
         if not domain_dest:
-            return
+            return False
 
-        print(f"Domain {domains.get('dest')} exists...")
+        print(f"Domain {domains.dest} exists...")
 
         del domain_src
         del domain_dest
 
         # Checking if product exists at source and destination
         print(
-            f"Checking if domain {domains.get('src')} has product {products.get('src')} at source instance({self.starburst_client_src.connection_info.host})"
+            f"Checking if domain {domains.src} has product {products.src} at source instance({self.starburst_client_src.connection_info.host})"
         )
-        product_src = self.starburst_client_src.get_data_product(
-            domain_name=domains.get("src"),
-            data_product_name=products.get("src"),
-            as_class=True,
+        product_src = self._get_data_product(
+            self.starburst_client_src, domains.src, products.src
         )
         if not product_src:
-            return
-
-        print(f"Domain {domains.get('src')} has product {products.get('src')}...")
+            return False
+
+        print(f"Domain {domains.src} has product {products.src}...")
+        if transform is not None:
+            self._run(
+                "transform",
+                lambda: transform.transform_datasets(
+                    product_src.views + product_src.materialized_views
+                ),
+                timed=False,
+            )
 
         print(
-            f"Checking if domain {domains.get('dest')} has product {products.get('dest')} at destination instance({self.starburst_client_dest.connection_info.host})"
+            f"Checking if domain {domains.dest} has product {products.dest} at destination instance({self.starburst_client_dest.connection_info.host})"
         )
-        product_dest = self.starburst_client_dest.get_data_product(
-            domain_name=domains.get("dest"),
-            data_product_name=products.get("dest"),
-            as_class=True,
+        product_dest = self._get_data_product(
+            self.starburst_client_dest, domains.dest, products.dest
         )
         if not product_dest:
-            return
+            return False
 
-        print(f"Domain {domains.get('dest')} has product {products.get('dest')}...")
+        print(f"Domain {domains.dest} has product {products.dest}...")
 
         # Existing datasets will be overwritten
+        self._capture("product", domains.dest, products.dest, product_dest)
         src_views_names = [view_src.name for view_src in product_src.views]
         src_mv_views_names = [
             mv_view_src.name for mv_view_src in product_src.materialized_views
@@ -329,15 +536,19 @@ class DatameshMigrator:
             if mv_view_dst.name not in src_mv_views_names
         ] + product_src.materialized_views
 
-        if self.starburst_client_dest.update_data_product(product_dest) == 200:
+        if self._write("update_data_product", product_dest) == 200:
             print(
                 "Les datasets suivants ont bien été migrés",
                 *src_views_names,
                 *src_mv_views_names,
                 sep=" ,",
             )
+            return True
+        return False
 
-    def migrate_all_domain_products(self, domains: dict):
+    def migrate_all_domain_products(
+        self, domains, transform: TransformationPipeline = None
+    ):
         """
         Migrates all data products from a source domain to a destination domain.
 
@@ -346,36 +557,36 @@ class DatameshMigrator:
         already exists in the destination domain, it will be overwritten.
 
         Args:
-            domains (dict): A dictionary containing the source and destination domain names.
+            domains (DomainPair | dict): The source and destination domain names.
                             Example: {'src': 'source_domain_name', 'dest': 'destination_domain_name'}
+            transform (TransformationPipeline): The transformations applied before the write, or None.
 
         Returns:
-            None
+            bool: True if all the products have been migrated, False otherwise.
         """
+        domains = DomainPair.of(domains)
+
         # Checking if domain source and domain destination exist
         print(
-            f"Checking if domain {domains.get('src')} exists at source instance({self.starburst_client_src.connection_info.host})"
-        )
-        domain_src = self.starburst_client_src.get_domain_by_name(
-            domain_name=domains.get("src"), as_class=True
+            f"Checking if domain {domains.src} exists at source instance({self.starburst_client_src.connection_info.host})"
         )
+        domain_src = self._get_domain(self.starburst_client_src, domains.src)
         if not domain_src:
-            return
+            return False
 
-        print(f"Domain {domains.get('src')} exists at source...")
+        print(f"Domain {domains.src} exists at source...")
 
         print(
-            f"Checking if domain {domains.get('dest')} exists at destination instance({self.starburst_client_dest.connection_info.host})"
-        )
-        domain_dest = self.starburst_client_dest.get_domain_by_name(
-            domain_name=domains.get("dest"), as_class=True
+            f"Checking if domain {domains.dest} exists at destination instance({self.starburst_client_dest.connection_info.host})"
         )
+        domain_dest = self._get_domain(self.starburst_client_dest, domains.dest)
         if not domain_dest:
-            return
+            return False
 
-        print(f"Domain {domains.get('dest')} exists...")
+        print(f"Domain {domains.dest} exists...")
 
         # Existing products will be overwritten
+        migrated = True
         products_dest_names = [
             product.get("name") for product in domain_dest.assigned_data_products
         ]
@@ -383,11 +594,19 @@ class DatameshMigrator:
         for product_name in [
             product.get("name") for product in domain_src.assigned_data_products
         ]:
-            product = self.starburst_client_src.get_data_product(
-                domain_name=domains.get("src"),
-                data_product_name=product_name,
-                as_class=True,
+            product = self._get_data_product(
+                self.starburst_client_src, domains.src, product_name
             )
+            if not product:
+                print(f"Product {product_name} not found at source")
+                migrated = False
+                continue
+            if transform is not None:
+                self._run(
+                    "transform",
+                    lambda: transform.transform_product(product),
+                    timed=False,
+                )
             product.data_domain_id = domain_dest.id
 
             # Overwrite product if exists at destination
@@ -398,11 +617,28 @@ class DatameshMigrator:
                         product.id = product_dest.get("id")
                         break
 
-                self.starburst_client_dest.update_data_product(product)
+                if self.rollback_journal is not None:
+                    self._capture(
+                        "product",
+                        domains.dest,
+                        product_name,
+                        self._get_data_product(
+                            self.starburst_client_dest, domains.dest, product_name
+                        ),
+                    )
+                migrated &= self._write("update_data_product", product) == 200
             else:
-                self.starburst_client_dest.create_data_product(product)
+                self._capture("product", domains.dest, product_name)
+                migrated &= self._write("create_data_product", product) == 200
+        return migrated
 
-    def migrate_from_starburst_files(self, directory: str):
+    def migrate_from_starburst_files(
+        self,
+        directory: str,
+        max_workers: int = 1,
+        state_path: str = None,
+        shards: int = 1,
+    ):
         """
         Migrates data products or datasets based on Starburst files configuration located in the specified directory.
 
@@ -412,174 +648,443 @@ class DatameshMigrator:
 
         Args:
             directory (str): The path to the directory containing the Starburst files.
+            max_workers (int): The maximum number of destination domains migrated concurrently.
+            state_path (str): The path of a json file recording the files already applied. Files
+                              whose content and source entities are unchanged since their last
+                              successful migration are skipped.
+            shards (int): The number of worker processes, see ``migrate_files``.
 
         Returns:
-            None
+            MigrationReport: The outcome of the migration of each file.
         """
-        starburst_files = read_starburst_files(directory)
+        starburst_files = read_starburst_files(
+            directory, as_class=True, profiler=self.profiler
+        )
 
         # Check if no valid files found
         if not starburst_files:
             print("No valid Starburst files found in the directory.")
-            return
+            return MigrationReport()
 
-        for file in starburst_files:
-            self._process_file(file)
+        state = MigrationState(state_path) if state_path else None
+        try:
+            return self.migrate_files(starburst_files, max_workers, state, shards)
+        finally:
+            if state:
+                state.save()
 
-    def _process_file(self, file):
+    def migrate_files(
+        self, starburst_files, max_workers: int = 1, state=None, shards: int = 1
+    ):
         """
-        Processes an individual Starburst file to migrate domains, products, and datasets.
+        Migrates the entities described by loaded Starburst files.
+
+        Files are grouped by destination domain. The files of a group are migrated in order,
+        while up to ``max_workers`` groups are migrated concurrently. When the migrator has a
+        deadline, the files not fully migrated in time are reported as pending.
 
-        This function checks whether a file contains specific keys like 'domainNameDest' and 'dataProducts',
-        and calls appropriate migration methods based on the file content.
+        With more than one shard, the groups are split into balanced shards, each one migrated
+        by a separate process with its own Starburst clients and ``max_workers`` threads. The
+        rollback journals of the shards are merged into the one of this migrator, and their
+        profiling reports are written to a 'shard<index>' subdirectory of its profiling reports.
 
         Args:
-            file (dict): A dictionary representing a single Starburst file.
+            starburst_files (list): The StarburstFile descriptors to migrate.
+            max_workers (int): The maximum number of destination domains migrated concurrently.
+            state (MigrationState): The files already applied, updated with the migrated ones. The
+                                    source entities of a file are fetched first to detect a
+                                    source changed since it was applied, then reused by its
+                                    migration.
+            shards (int): The number of worker processes, 1 to migrate in this process.
 
         Returns:
-            None
+            MigrationReport: The outcome of the migration of each file.
         """
-        # Migrate domain if needed
-        if "domainNameDest" not in file:
-            self._migrate_domain_and_set_dest(file)
+        report = MigrationReport()
+        start = time.perf_counter()
+        shared = self.single_flight.shared if self.single_flight else 0
 
-        # Migrate domain products
-        if "dataProducts" not in file:
-            self._migrate_all_domain_products(file)
+        if shards > 1:
+            results = self._migrate_shards(starburst_files, max_workers, shards, state)
+        else:
+            results = self._migrate_groups(starburst_files, max_workers, state)
+
+        for file, migrated, source_hash in results:
+            if migrated == _SKIPPED:
+                report.skip(file)
+                continue
+            report.record(file, migrated)
+            if migrated and state is not None:
+                state.add(file, source_hash)
+
+        if self.single_flight is not None:
+            report.shared_lookups = self.single_flight.shared - shared
+        report.elapsed = time.perf_counter() - start
+        return report
+
+    def _source_hash(self, file: StarburstFile):
+        """
+        Hashes the content of the source domain and products migrated by a starburst file.
+
+        The fetched entities are kept for the migration of the file by this thread, so they are
+        requested once.
+
+        Returns:
+            str: The hash of the source content, or None if it cannot be read.
+        """
+        self._prefetched.entities = {}
+        self._prefetched.recording = True
+        try:
+            domain = self._get_domain(self.starburst_client_src, file.domains.src)
+            if not domain:
+                return None
+            if file.products is None:
+                names = [
+                    product.get("name") for product in domain.assigned_data_products
+                ]
+            else:
+                names = [product.src for product in file.products]
+            products = {
+                name: self._get_data_product(
+                    self.starburst_client_src, file.domains.src, name
+                )
+                for name in dict.fromkeys(names)
+            }
+        except Exception as err:
+            # The file is migrated anyway, its source content is unknown
+            print(f"Source of {file.label} not read: {err!r}")
+            return None
+        finally:
+            self._prefetched.recording = False
+        return content_hash(
+            {"domain": domain if file.migrate_domain else None, "products": products}
+        )
+
+    def _migrate_groups(self, starburst_files, max_workers: int, state=None):
+        """
+        Migrates starburst files grouped by destination domain in a thread pool.
+
+        Returns:
+            list: The (StarburstFile, outcome, source hash) of each file, see ``_migrate_file``.
+        """
+
+        def migrate_group(files):
+            return [(file, *self._migrate_file(file, state)) for file in files]
+
+        groups = group_by_destination(starburst_files)
+        if max_workers > 1 and len(groups) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(migrate_group, groups))
         else:
-            self._migrate_data_products(file)
+            results = [migrate_group(files) for files in groups]
+        return [result for group in results for result in group]
 
-    def _migrate_domain_and_set_dest(self, file):
+    def _migrate_file(self, file: StarburstFile, state=None):
         """
-        Migrates the domain and sets the 'domainNameDest' in the file.
+        Migrates a starburst file unless the deadline is reached or it is already applied.
 
-        This function migrates the domain using the 'domainNameSrc' from the file and sets
-        the 'domainNameDest' to the same value as 'domainNameSrc'.
+        An error raised by the migration of the file fails the file only.
 
         Args:
-            file (dict): A dictionary representing a single Starburst file.
+            file (StarburstFile): The file to migrate.
+            state (MigrationState): The files already applied, or None to migrate the file anyway.
 
         Returns:
-            None
+            tuple: The outcome, True if every migration of the file succeeded, False otherwise,
+                   None if the file has not been fully migrated in time or 'skipped' if it is
+                   already applied, and the hash of its source content, or None if unknown.
         """
-        self.migrate_domain(domain_name=file.get("domainNameSrc"))
-        file["domainNameDest"] = file.get("domainNameSrc")
+        if self.deadline is not None and self.deadline.expired:
+            print(f"Deadline reached, {file.label} left pending")
+            return None, None
+        source_hash = None
+        try:
+            if state is not None:
+                source_hash = self._source_hash(file)
+                if state.is_applied(file, source_hash):
+                    print(f"{file.label} already applied, skipping")
+                    return _SKIPPED, source_hash
+            return self._process_file(file), source_hash
+        except MigrationTimeout as err:
+            print(f"{file.label} interrupted and left pending: {err}")
+            return None, source_hash
+        except Exception as err:
+            # Keeps migrating the other files, whatever the client raised
+            print(f"Migration of {file.label} failed: {err!r}")
+            return False, source_hash
+        finally:
+            self._prefetched.entities = None
+
+    def _migrate_shards(
+        self, starburst_files, max_workers: int, shards: int, state=None
+    ):
+        """
+        Migrates starburst files split into shards, each one in a worker process.
+
+        When a worker process fails, every file of its shard is reported as failed, and the
+        outcome of the other shards is kept. The phase budgets left are split evenly between
+        the shards, so they bound the cumulated duration of all the shards.
 
-    def _migrate_all_domain_products(self, file):
+        Returns:
+            list: The (StarburstFile, outcome, source hash) of each file, see ``_migrate_file``.
         """
-        Migrates all products within a domain.
+        partition = partition_shards(starburst_files, shards)
+        journal = self.rollback_journal
+        journal_paths = [
+            f"{journal.path}.shard{index}" if journal else None
+            for index in range(len(partition))
+        ]
+        profile_dirs = [
+            os.path.join(self.profiler.directory, f"shard{index}")
+            if self.profiler.enabled
+            else None
+            for index in range(len(partition))
+        ]
+        deadline = self.deadline.share(len(partition)) if self.deadline else None
+        print(f"Migrating {len(starburst_files)} files in {len(partition)} shards")
+
+        results = []
+        try:
+            with ProcessPoolExecutor(max_workers=len(partition)) as executor:
+                futures = [
+                    executor.submit(
+                        _migrate_shard,
+                        self.starburst_client_src.connection_info,
+                        self.starburst_client_dest.connection_info,
+                        journal_path,
+                        self.single_flight is not None,
+                        profile_dir,
+                        deadline,
+                        files,
+                        max_workers,
+                        state,
+                    )
+                    for files, journal_path, profile_dir in zip(
+                        partition, journal_paths, profile_dirs
+                    )
+                ]
+                for files, future in zip(partition, futures):
+                    try:
+                        shard_results, shared = future.result()
+                    except Exception as err:
+                        # The files of the shard may be partially migrated
+                        print(f"Shard of {len(files)} files failed: {err!r}")
+                        results.extend((file, False, None) for file in files)
+                        continue
+                    results.extend(shard_results)
+                    if self.single_flight is not None:
+                        self.single_flight.shared += shared
+        finally:
+            if journal:
+                for journal_path in journal_paths:
+                    journal.absorb(journal_path)
+        return results
+
+    def rollback(self, rollback_paths, max_workers: int = 8):
+        """
+        Restores the destination entities recorded in rollback journals.
 
-        This function handles the migration of all products for a specific domain, using the source and
-        destination domain names provided in the file.
+        Overwritten domains and products are restored concurrently to their recorded state. An
+        entity whose restoration fails is listed as failed, the others are still restored.
+        Entities created by the migration are not deleted, they are listed so they can be
+        removed by hand.
 
         Args:
-            file (dict): A dictionary representing a single Starburst file.
+            rollback_paths (list): The paths of the rollback journals.
+            max_workers (int): The maximum number of concurrent restorations.
 
         Returns:
-            None
+            dict: The 'restored', 'failed' and 'created' entities, as 'domain' or 'domain/product' names.
         """
-        self.migrate_all_domain_products(
-            domains={
-                "src": file.get("domainNameSrc"),
-                "dest": file.get("domainNameDest"),
-            }
-        )
+        records = {}
+        for path in rollback_paths:
+            for record in read_journal(path):
+                records.setdefault(
+                    (record["kind"], record["domain"], record["name"]), record
+                )
 
-    def _migrate_data_products(self, file):
+        def label(record):
+            if record["kind"] == "domain":
+                return record["name"]
+            return f"{record['domain']}/{record['name']}"
+
+        def restore(record):
+            print(f"Restoring {record['kind']} {label(record)}")
+            try:
+                if record["kind"] == "domain":
+                    return self._write("update_domain", domain=record["entity"]) == 200
+                return self._write("update_data_product", record["entity"]) == 200
+            except MigrationTimeout as err:
+                print(f"Restoration of {label(record)} interrupted: {err}")
+                return False
+            except Exception as err:
+                # Keeps restoring the other entities, whatever the client raised
+                print(f"Restoration of {label(record)} failed: {err!r}")
+                return False
+
+        updated = [
+            record for record in records.values() if record["action"] == "update"
+        ]
+        result = {
+            "restored": [],
+            "failed": [],
+            "created": [
+                label(record)
+                for record in records.values()
+                if record["action"] == "create"
+            ],
+        }
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for record, restored in zip(updated, executor.map(restore, updated)):
+                result["restored" if restored else "failed"].append(label(record))
+
+        for name in result["created"]:
+            print(f"{name} has been created by the migration, delete it by hand if needed")
+        return result
+
+    def verify_from_starburst_files(self, directory: str, max_workers: int = 8):
         """
-        Processes and migrates each product in the 'dataProducts' section of the file.
+        Verifies that the entities described by the Starburst files match between both instances.
 
-        This function iterates through each product in the file and delegates the migration process to
-        a helper method for each product.
+        The domains, products and datasets targeted by each file are fetched concurrently from the
+        source and destination instances, then the hashes of their normalized content are compared.
+        Fields set by the destination instance (ids, catalog name, audit fields) are ignored.
 
         Args:
-            file (dict): A dictionary representing a single Starburst file.
+            directory (str): The path to the directory containing the Starburst files.
+            max_workers (int): The maximum number of concurrent fetches.
 
         Returns:
-            None
+            VerificationReport: The report listing the mismatches found.
         """
-        for product in file.get("dataProducts"):
-            self._process_product(file, product)
+        starburst_files = read_starburst_files(directory, as_class=True)
 
-    def _process_product(self, file, product):
+        report = DatameshVerifier(
+            self.starburst_client_src, self.starburst_client_dest, max_workers
+        ).verify(starburst_files)
+
+        for mismatch in report.mismatches:
+            print(f"Mismatch: {mismatch}")
+        print(
+            f"Verified {report.checked['domain']} domains, {report.checked['product']} products "
+            f"and {report.checked['dataset']} datasets: {len(report.mismatches)} mismatches"
+        )
+        return report
+
+    def _process_file(self, file: StarburstFile):
         """
-        Processes an individual product and migrates it, including its datasets if applicable.
+        Processes an individual Starburst file to migrate domains, products, and datasets.
 
-        This function checks if a product has datasets and either migrates the entire product or
-        its datasets accordingly.
+        This function migrates the domain when the file has no destination domain, then
+        calls appropriate migration methods based on the products of the file.
 
         Args:
-            file (dict): A dictionary representing a single Starburst file.
-            product (dict): A dictionary representing a single product.
+            file (StarburstFile): The descriptor of a single Starburst file.
 
         Returns:
-            None
+            bool: True if every migration of the file succeeded, False otherwise.
         """
-        # Migrate all product datasets if needed
-        if "datasets" not in product:
-            self._migrate_product_or_datasets(file, product)
+        migrated = True
+
+        # Migrate domain if needed
+        if file.migrate_domain:
+            migrated = self.migrate_domain(domain_name=file.domains.src)
+
+        # Migrate domain products
+        if file.products is None:
+            migrated &= self.migrate_all_domain_products(
+                domains=file.domains, transform=file.transform
+            )
         else:
-            self._migrate_datasets(file, product)
+            for product in file.products:
+                migrated &= self._process_product(file, product)
+        return migrated
 
-    def _migrate_product_or_datasets(self, file, product):
+    def _process_product(self, file: StarburstFile, product: ProductSpec):
         """
-        Migrates either the product or all datasets, depending on the product's structure.
+        Processes an individual product and migrates it, including its datasets if applicable.
 
-        If the product has a 'productDestName', it migrates all datasets associated with the product.
-        Otherwise, it migrates just the product.
+        If the product lists datasets, only these datasets are migrated. Otherwise, if the product
+        has a destination product name, all its datasets are migrated into it, else the whole
+        product is migrated.
 
         Args:
-            file (dict): A dictionary representing a single Starburst file.
-            product (dict): A dictionary representing a single product.
+            file (StarburstFile): The descriptor of a single Starburst file.
+            product (ProductSpec): The descriptor of a single product.
 
         Returns:
-            None
-        """
-        if "productDestName" in product:
-            self.migrate_all_product_datasets(
-                domains={
-                    "src": file.get("domainNameSrc"),
-                    "dest": file.get("domainNameDest"),
-                },
-                products={
-                    "src": product.get("productSrcName"),
-                    "dest": product.get("productDestName"),
-                },
-            )
-        else:
-            self.migrate_product(
-                domains={
-                    "src": file.get("domainNameSrc"),
-                    "dest": file.get("domainNameDest"),
-                },
-                product=product.get("productSrcName"),
+            bool: True if the product or its datasets have been migrated, False otherwise.
+        """
+        if product.datasets is not None:
+            return self._migrate_datasets(file, product)
+        if product.dest is not None:
+            return self.migrate_all_product_datasets(
+                domains=file.domains, products=product, transform=file.transform
             )
+        return self.migrate_product(
+            domains=file.domains, product=product.src, transform=file.transform
+        )
 
-    def _migrate_datasets(self, file, product):
+    def _migrate_datasets(self, file: StarburstFile, product: ProductSpec):
         """
         Migrates the datasets within a product.
 
-        This function iterates through the datasets of a product and delegates the migration
-        of each dataset to the 'migrate_dataset' method.
+        This function groups the datasets of a product by destination product and delegates
+        the migration of each group to the 'migrate_datasets' method, so every destination
+        product is fetched and written once.
 
         Args:
-            file (dict): A dictionary representing a single Starburst file.
-            product (dict): A dictionary representing a single product.
+            file (StarburstFile): The descriptor of a single Starburst file.
+            product (ProductSpec): The descriptor of a single product.
 
         Returns:
-            None
-        """
-        for dataset in product.get("datasets"):
-            self.migrate_dataset(
-                migrant=DatasetMigrant(
-                    dataset=dataset,
-                    products_names={
-                        "src": product.get("productSrcName"),
-                        "dest": product.get("productDestName"),
-                    },
-                    domains_names={
-                        "src": file.get("domainNameSrc"),
-                        "dest": file.get("domainNameDest"),
-                    },
-                )
+            bool: True if all the datasets have been migrated, False otherwise.
+        """
+        targets = {}
+        for dataset in product.datasets:
+            targets.setdefault(dataset.product_dest or product.dest, []).append(dataset)
+
+        migrated = True
+        for product_dest, datasets in targets.items():
+            migrated &= self.migrate_datasets(
+                domains=file.domains,
+                products=ProductSpec(product.src, product_dest),
+                datasets=datasets,
+                transform=file.transform,
             )
+        return migrated
+
+
+def _migrate_shard(
+    connection_info_src,
+    connection_info_dest,
+    rollback_path,
+    coalesce_lookups,
+    profile_dir,
+    deadline,
+    starburst_files,
+    max_workers,
+    state,
+):
+    """
+    Migrates a shard of starburst files in a worker process.
+
+    Returns:
+        tuple: The list of (StarburstFile, outcome, source hash) of each file, and the number of
+               lookups answered by another in-flight lookup.
+    """
+    from datamesh_migration.profiling import MigrationProfiler
+
+    with (
+        MigrationProfiler(profile_dir) if profile_dir else contextlib.nullcontext()
+    ) as profiler:
+        migrator = DatameshMigrator(
+            connection_info_src,
+            connection_info_dest,
+            rollback_path=rollback_path,
+            coalesce_lookups=coalesce_lookups,
+            profiler=profiler,
+            deadline=deadline,
+        )
+        results = migrator._migrate_groups(starburst_files, max_workers, state)
+        return results, migrator.single_flight.shared if coalesce_lookups else 0
@@ -16,6 +16,15 @@ class DatasetMigrant:
         domain_dest (str): The destination domain name.
     """
 
+    __slots__ = (
+        "name",
+        "type",
+        "product_src",
+        "product_dest",
+        "domain_src",
+        "domain_dest",
+    )
+
     def __init__(self, dataset: dict, products_names: dict, domains_names: str):
         """
         Initialize the DatasetMigrant with dataset, product names, and domain names.
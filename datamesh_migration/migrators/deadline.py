@@ -0,0 +1,230 @@
+"""
+Classes to bound the duration of migrations with a deadline, call timeouts and phase budgets
+"""
+import queue
+import threading
+import time
+
+
+class MigrationTimeout(TimeoutError):
+    """
+    Raised when a call exceeds its timeout, a phase its budget, or the migration its deadline.
+
+    Attributes:
+        phase (str): The phase of the call, like 'fetch' or 'write'.
+    """
+
+    def __init__(self, message: str, phase: str = None):
+        super().__init__(message)
+        self.phase = phase
+
+
+class Deadline:
+    """
+    Time limits of a migration.
+
+    - The deadline bounds the whole migration. Once reached, every next call raises.
+    - The call timeout bounds each call to an instance.
+    - The phase budgets bound the cumulated duration of the calls of a phase ('fetch',
+      'transform' or 'write'). When a budget is spent, the next calls of the phase raise.
+
+    Only reads are interrupted: a fetch which times out is abandoned to a daemon thread, and the
+    threads running the fetches are reused from one call to the next. Writes are never
+    interrupted: the deadline and the write budget are checked before a write starts, then the
+    write runs to its end, so the outcome of every write is known.
+
+    Deadlines can be sent to worker processes, which get the same deadline and the budgets left.
+    The budgets are cumulated over every thread of a process; to keep the same total over several
+    processes, give each one a ``share`` of the deadline.
+    """
+
+    def __init__(
+        self,
+        timeout: float = None,
+        call_timeout: float = None,
+        phase_budgets: dict = None,
+        expires_at: float = None,
+    ):
+        """
+        Args:
+            timeout (float): The duration of the migration in seconds, from now. No deadline if None.
+            call_timeout (float): The maximum duration of a call in seconds. No timeout if None.
+            phase_budgets (dict): The maximum cumulated duration of the calls of each phase in seconds.
+            expires_at (float): The deadline as a ``time.time()`` timestamp, instead of ``timeout``.
+        """
+        if expires_at is None and timeout is not None:
+            expires_at = time.time() + timeout
+        self.expires_at = expires_at
+        self.call_timeout = call_timeout
+        self.phase_budgets = dict(phase_budgets or {})
+        self._spent = {}
+        self._lock = threading.Lock()
+        self._expired = threading.Event()
+        self._pool = _CallPool()
+
+    def __reduce__(self):
+        return (
+            type(self),
+            (None, self.call_timeout, self.remaining_budgets(), self.expires_at),
+        )
+
+    def share(self, parts: int):
+        """
+        Returns a deadline with the same deadline and call timeout, and a part of the budgets left.
+
+        Args:
+            parts (int): The number of parts the budgets left are split into.
+
+        Returns:
+            Deadline: The deadline of one of the parts.
+        """
+        return type(self)(
+            call_timeout=self.call_timeout,
+            phase_budgets={
+                phase: budget / parts
+                for phase, budget in self.remaining_budgets().items()
+            },
+            expires_at=self.expires_at,
+        )
+
+    def remaining_budgets(self):
+        """
+        Returns:
+            dict: The seconds left in the budget of each phase.
+        """
+        with self._lock:
+            return {
+                phase: budget - self._spent.get(phase, 0.0)
+                for phase, budget in self.phase_budgets.items()
+            }
+
+    def remaining(self, phase: str = None):
+        """
+        Returns the seconds left before the deadline or the end of the budget of a phase.
+
+        Args:
+            phase (str): The phase whose budget is considered, or None for the deadline only.
+
+        Returns:
+            float: The seconds left, or None if there is no limit.
+        """
+        limits = []
+        if self.expires_at is not None:
+            limits.append(self.expires_at - time.time())
+        if phase in self.phase_budgets:
+            with self._lock:
+                limits.append(self.phase_budgets[phase] - self._spent.get(phase, 0.0))
+        return min(limits) if limits else None
+
+    @property
+    def expired(self):
+        """bool: True once the deadline of the migration is reached."""
+        if not self._expired.is_set():
+            remaining = self.remaining()
+            if remaining is not None and remaining <= 0:
+                self._expired.set()
+        return self._expired.is_set()
+
+    def check(self, phase: str):
+        """
+        Raises MigrationTimeout if the deadline is reached or the budget of the phase is spent.
+
+        Args:
+            phase (str): The phase of the next call.
+        """
+        if self.expired:
+            raise MigrationTimeout("Migration deadline reached", phase)
+        remaining = self.remaining(phase)
+        if remaining is not None and remaining <= 0:
+            raise MigrationTimeout(f"Budget of phase {phase} spent", phase)
+
+    def run(self, phase: str, function, timed: bool = True):
+        """
+        Runs a call of a phase within the time left, and adds its duration to the phase.
+
+        Args:
+            phase (str): The phase of the call.
+            function (callable): The call, without arguments.
+            timed (bool): If False, the call is only checked before it starts and always runs to
+                          its end. Used for writes, which must not be abandoned, and in-memory work.
+
+        Returns:
+            The result of the call.
+
+        Raises:
+            MigrationTimeout: If the call cannot start or does not finish in time.
+        """
+        self.check(phase)
+        timeout = self.remaining(phase)
+        if self.call_timeout is not None:
+            timeout = (
+                self.call_timeout if timeout is None else min(timeout, self.call_timeout)
+            )
+
+        start = time.perf_counter()
+        try:
+            if not timed or timeout is None:
+                return function()
+            return self._pool.call(function, timeout, phase)
+        finally:
+            with self._lock:
+                self._spent[phase] = (
+                    self._spent.get(phase, 0.0) + time.perf_counter() - start
+                )
+
+
+class _CallPool:
+    """
+    Daemon threads running the timed calls, reused from one call to the next.
+
+    A call which does not finish in time is abandoned to its thread, daemon so that a hung call
+    neither blocks the migration nor the exit of the interpreter. A new thread is started only
+    when every thread is busy, so there are as many threads as concurrent or hung calls.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = queue.SimpleQueue()
+        self._idle = 0
+        self.threads = 0
+
+    def call(self, function, timeout: float, phase: str):
+        """
+        Runs a call in a thread of the pool and waits for it at most ``timeout`` seconds.
+
+        Raises:
+            MigrationTimeout: If the call does not finish in time.
+        """
+        outcome = {}
+        done = threading.Event()
+        with self._lock:
+            if self._idle:
+                self._idle -= 1
+            else:
+                self.threads += 1
+                threading.Thread(
+                    target=self._work,
+                    name=f"datamesh-call-{self.threads}",
+                    daemon=True,
+                ).start()
+        self._calls.put((function, outcome, done))
+
+        if not done.wait(timeout):
+            raise MigrationTimeout(
+                f"Call of phase {phase} did not finish within {timeout:.1f}s", phase
+            )
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["result"]
+
+    def _work(self):
+        while True:
+            function, outcome, done = self._calls.get()
+            try:
+                outcome["result"] = function()
+            except BaseException as err:  # re-raised in the calling thread
+                outcome["error"] = err
+            finally:
+                with self._lock:
+                    self._idle += 1
+                done.set()
@@ -0,0 +1,141 @@
+"""
+Classes to report and persist the outcome of migrations from starburst files
+"""
+import hashlib
+import json
+import os
+
+
+class MigrationReport:
+    """
+    Outcome of the migration of a set of starburst files.
+
+    Attributes:
+        done (list): The labels of the files fully migrated.
+        failed (list): The labels of the files with at least one failed migration.
+        pending (list): The labels of the files not fully migrated before the deadline.
+        skipped (list): The labels of the files already applied according to the migration state.
+        shared_lookups (int): The number of domain and product lookups answered by an identical
+                              lookup already in flight, instead of a request to the instance.
+        elapsed (float): The duration of the migration in seconds.
+    """
+
+    __slots__ = ("done", "failed", "pending", "skipped", "shared_lookups", "elapsed")
+
+    def __init__(self):
+        self.done = []
+        self.failed = []
+        self.pending = []
+        self.skipped = []
+        self.shared_lookups = 0
+        self.elapsed = 0.0
+
+    @property
+    def ok(self):
+        """bool: True if no file failed or is pending."""
+        return not self.failed and not self.pending
+
+    def record(self, file, migrated: bool):
+        """
+        Records the outcome of the migration of a file.
+
+        Args:
+            file (StarburstFile): The migrated file.
+            migrated (bool): Whether every migration of the file succeeded, None if the file
+                             has not been fully migrated before the deadline.
+        """
+        if migrated is None:
+            self.pending.append(file.label)
+        else:
+            (self.done if migrated else self.failed).append(file.label)
+
+    def skip(self, file):
+        """
+        Records a file which has not been migrated because it was already applied.
+
+        Args:
+            file (StarburstFile): The skipped file.
+        """
+        self.skipped.append(file.label)
+
+    def as_dict(self):
+        """Returns the report as a dictionary."""
+        return {
+            "ok": self.ok,
+            "done": list(self.done),
+            "failed": list(self.failed),
+            "pending": list(self.pending),
+            "skipped": list(self.skipped),
+            "shared_lookups": self.shared_lookups,
+            "elapsed": round(self.elapsed, 3),
+        }
+
+
+class MigrationState:
+    """
+    Fingerprints of the starburst files already applied, persisted in a json file.
+
+    It allows incremental runs: a file is skipped when neither its content nor the content of
+    the source entities it migrates have changed since its last successful migration. The source
+    content is given as a hash, a file whose source could not be read is never skipped.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): The path of the json state file. It is created on save if missing.
+        """
+        self.path = path
+        self.applied = set()
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                self.applied = set(json.load(file).get("applied", []))
+
+    @staticmethod
+    def fingerprint(file, source_hash: str):
+        """
+        Computes the fingerprint of a starburst file applied with a given source content.
+
+        Args:
+            file (StarburstFile): The starburst file.
+            source_hash (str): The hash of the source entities migrated by the file.
+
+        Returns:
+            str: The sha256 hex digest of the file and source fingerprints.
+        """
+        content = f"{file.fingerprint()}:{source_hash}"
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def is_applied(self, file, source_hash: str):
+        """
+        Checks if a starburst file has already been applied with the same source content.
+
+        Args:
+            file (StarburstFile): The starburst file.
+            source_hash (str): The hash of the source entities migrated by the file, or None.
+
+        Returns:
+            bool: True if the file can be skipped, False otherwise.
+        """
+        return (
+            source_hash is not None
+            and self.fingerprint(file, source_hash) in self.applied
+        )
+
+    def add(self, file, source_hash: str):
+        """
+        Marks a starburst file as applied, unless its source content is unknown.
+
+        Args:
+            file (StarburstFile): The applied file.
+            source_hash (str): The hash of the source entities migrated by the file, or None.
+        """
+        if source_hash is not None:
+            self.applied.add(self.fingerprint(file, source_hash))
+
+    def save(self):
+        """Writes the state file."""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({"applied": sorted(self.applied)}, file, indent=2)
+        os.replace(tmp_path, self.path)
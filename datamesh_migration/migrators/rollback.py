@@ -0,0 +1,108 @@
+"""
+Class to record the state of destination entities before a migration overwrites them
+"""
+import gzip
+import os
+import pickle
+import shutil
+import threading
+
+
+class RollbackJournal:
+    """
+    Append only file of the pre-write state of the destination entities touched by a migration.
+
+    Each record is a pickled dictionary stored as its own gzip member, so a record is either
+    fully written or ignored when the journal is read back. Only the first state of an entity is
+    kept, it is the state the entity had before the first migration recorded in the journal.
+
+    Journals contain pickled starburst entities: only load journals written by this package.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): The path of the journal. Records are appended if it already exists.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._captured = {
+            (record["kind"], record["domain"], record["name"])
+            for record in read_journal(path)
+        }
+
+    def capture(self, kind: str, domain_name: str, name: str, entity=None):
+        """
+        Records the state of a destination entity before it is overwritten or created.
+
+        Args:
+            kind (str): The kind of the entity ('domain' or 'product').
+            domain_name (str): The name of the domain of the entity.
+            name (str): The name of the entity.
+            entity: The current entity, or None if the migration is about to create it.
+        """
+        key = (kind, domain_name, name)
+        with self._lock:
+            if key in self._captured:
+                return
+            record = {
+                "kind": kind,
+                "domain": domain_name,
+                "name": name,
+                "action": "create" if entity is None else "update",
+                "entity": entity,
+            }
+            # Pickled before returning, later mutations of the entity are not recorded
+            payload = gzip.compress(
+                pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+            )
+            with open(self.path, "ab") as file:
+                file.write(payload)
+            self._captured.add(key)
+
+    def absorb(self, path: str):
+        """
+        Appends the records of another journal to this one and removes it.
+
+        Args:
+            path (str): The path of the journal to absorb, ignored if it does not exist.
+        """
+        if not os.path.exists(path):
+            return
+        with self._lock:
+            with open(path, "rb") as source, open(self.path, "ab") as file:
+                shutil.copyfileobj(source, file)
+            self._captured.update(
+                (record["kind"], record["domain"], record["name"])
+                for record in read_journal(path)
+            )
+        os.remove(path)
+
+
+def read_journal(path: str):
+    """
+    Reads the records of a rollback journal, keeping the first one of each entity.
+
+    Args:
+        path (str): The path of the journal.
+
+    Returns:
+        list: The records, as dictionaries with 'kind', 'domain', 'name', 'action' and 'entity' keys.
+    """
+    if not os.path.exists(path):
+        return []
+
+    records = {}
+    with gzip.open(path, "rb") as file:
+        try:
+            while True:
+                record = pickle.load(file)
+                records.setdefault(
+                    (record["kind"], record["domain"], record["name"]), record
+                )
+        except EOFError:
+            pass
+        except (OSError, pickle.UnpicklingError) as err:
+            # Truncated last record of an interrupted migration
+            print(f"Stopped reading {path} at a corrupted record: {err}")
+    return list(records.values())
@@ -0,0 +1,79 @@
+"""
+Class to share one in-flight request between concurrent identical lookups
+"""
+import copy
+import threading
+
+
+class _Call:
+    """An in-flight call and its outcome."""
+
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key into a single call.
+
+    The first caller of a key runs the call, the callers arriving while it is in flight wait for
+    it and receive a deep copy of its result, so every caller can mutate the entity it gets.
+    Nothing is cached: once the call is over, the next caller of the key runs a new call.
+
+    Attributes:
+        shared (int): The number of calls answered by another caller's in-flight call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+
+    def do(self, key, function):
+        """
+        Runs ``function`` unless a call with the same key is in flight, then waits for its result.
+
+        Args:
+            key: A hashable identifying the call.
+            function (callable): The call, without arguments.
+
+        Returns:
+            The result of the call, or a deep copy of it for the callers which did not run it.
+
+        Raises:
+            Exception: The exception raised by the call, re-raised in every waiting caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        result = None
+        try:
+            result = function()
+        except Exception as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            # No caller can join anymore; the waiters copy a snapshot the leader never mutates
+            if call.waiters and call.error is None:
+                call.result = copy.deepcopy(result)
+            call.done.set()
+        return result
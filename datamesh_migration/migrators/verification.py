@@ -0,0 +1,411 @@
+"""
+Classes to verify that migrated datamesh entities match between two instances of starburst
+"""
+import copy
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from datamesh_migration.files.starburst_descriptors import StarburstFile
+
+# Fields set by the destination instance, they are not part of the migrated content
+VOLATILE_FIELDS = frozenset(
+    {
+        "id",
+        "data_domain_id",
+        "dataDomainId",
+        "catalog_name",
+        "catalogName",
+        "assigned_data_products",
+        "assignedDataProducts",
+        "created_at",
+        "createdAt",
+        "created_by",
+        "createdBy",
+        "updated_at",
+        "updatedAt",
+        "updated_by",
+        "updatedBy",
+        "published_at",
+        "publishedAt",
+        "published_by",
+        "publishedBy",
+    }
+)
+
+DATASET_FIELDS = ("views", "materialized_views")
+
+
+def normalize(entity, ignored=VOLATILE_FIELDS):
+    """
+    Converts an entity into plain python structures without its instance specific fields.
+
+    Args:
+        entity: A starburst entity (class instance or dict), or any nested value of it.
+        ignored (frozenset): The field names removed from every mapping.
+
+    Returns:
+        The normalized value made of dicts, lists and scalars.
+    """
+    if isinstance(entity, dict):
+        return {
+            str(key): normalize(value, ignored)
+            for key, value in entity.items()
+            if key not in ignored
+        }
+    if isinstance(entity, (list, tuple)):
+        return [normalize(value, ignored) for value in entity]
+    if hasattr(entity, "__dict__"):
+        return normalize(vars(entity), ignored)
+    return entity
+
+
+def content_hash(entity, ignored=VOLATILE_FIELDS):
+    """
+    Computes the hash of the normalized content of an entity.
+
+    Args:
+        entity: A starburst entity (class instance or dict).
+        ignored (frozenset): The field names excluded from the hash.
+
+    Returns:
+        str: The sha256 hex digest of the normalized content.
+    """
+    payload = json.dumps(
+        normalize(entity, ignored), sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Mismatch:
+    """
+    A difference found between the source and the destination instances.
+
+    Attributes:
+        level (str): The level of the entity ('domain', 'product' or 'dataset').
+        domain (str): The destination domain name.
+        product (str): The destination product name, or None for a domain.
+        dataset (str): The dataset name, or None for a domain or a product.
+        reason (str): Why the entities do not match ('missing', 'content' or 'error' when
+                      one of them could not be fetched).
+    """
+
+    __slots__ = ("level", "domain", "product", "dataset", "reason")
+
+    def __init__(self, level, domain, product=None, dataset=None, reason="content"):
+        self.level = level
+        self.domain = domain
+        self.product = product
+        self.dataset = dataset
+        self.reason = reason
+
+    def as_dict(self):
+        """Returns the mismatch as a dictionary."""
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __str__(self):
+        path = "/".join(
+            name for name in (self.domain, self.product, self.dataset) if name
+        )
+        return f"{self.level} {path}: {self.reason}"
+
+
+class VerificationReport:
+    """
+    Result of a verification pass.
+
+    Attributes:
+        checked (dict): The number of compared entities per level.
+        mismatches (list): The Mismatch found.
+    """
+
+    __slots__ = ("checked", "mismatches")
+
+    def __init__(self):
+        self.checked = {"domain": 0, "product": 0, "dataset": 0}
+        self.mismatches = []
+
+    @property
+    def ok(self):
+        """bool: True if no mismatch was found."""
+        return not self.mismatches
+
+    def add(self, level, domain, product=None, dataset=None, reason=None):
+        """
+        Counts a compared entity and records a mismatch if a reason is given.
+        """
+        self.checked[level] += 1
+        if reason:
+            self.mismatches.append(Mismatch(level, domain, product, dataset, reason))
+
+    def as_dict(self):
+        """Returns the report as a dictionary."""
+        return {
+            "ok": self.ok,
+            "checked": dict(self.checked),
+            "mismatches": [mismatch.as_dict() for mismatch in self.mismatches],
+        }
+
+
+class _FetchError:
+    """Result of a fetch which raised, recorded as an 'error' mismatch."""
+
+    __slots__ = ("error",)
+
+    def __init__(self, error):
+        self.error = error
+
+
+class DatameshVerifier:
+    """
+    Compare the migrated domains, products and datasets of a source and a destination instance.
+
+    Every entity is fetched once, all fetches of a stage running concurrently.
+    """
+
+    def __init__(self, starburst_client_src, starburst_client_dest, max_workers=8):
+        """
+        Args:
+            starburst_client_src (Starburst): The client of the source instance.
+            starburst_client_dest (Starburst): The client of the destination instance.
+            max_workers (int): The maximum number of concurrent fetches.
+        """
+        self.clients = {"src": starburst_client_src, "dest": starburst_client_dest}
+        self.max_workers = max_workers
+
+    def _fetch_all(self, executor, keys, fetch):
+        """
+        Fetches every key concurrently and returns a dict of the results.
+
+        A fetch which raises does not abort the others, its key is mapped to a _FetchError.
+        """
+
+        def fetch_or_error(key):
+            try:
+                return fetch(key)
+            except Exception as err:
+                print(f"Fetch of {'/'.join(key)} failed: {err!r}")
+                return _FetchError(err)
+
+        keys = list(dict.fromkeys(keys))
+        return dict(zip(keys, executor.map(fetch_or_error, keys)))
+
+    def _fetch_domain(self, key):
+        side, domain_name = key
+        return self.clients[side].get_domain_by_name(
+            domain_name=domain_name, as_class=True
+        )
+
+    def _fetch_product(self, key):
+        side, domain_name, product_name = key
+        return self.clients[side].get_data_product(
+            domain_name=domain_name, data_product_name=product_name, as_class=True
+        )
+
+    def verify(self, starburst_files):
+        """
+        Verifies that the entities described by the starburst files match between both instances.
+
+        Args:
+            starburst_files (list): The StarburstFile descriptors of the migration.
+
+        Returns:
+            VerificationReport: The report of the verification.
+        """
+        report = VerificationReport()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            domains = self._fetch_all(
+                executor,
+                [
+                    (side, name)
+                    for file in starburst_files
+                    for side, name in (
+                        ("src", file.domains.src),
+                        ("dest", file.domains.dest),
+                    )
+                ],
+                self._fetch_domain,
+            )
+
+            checks = []
+            compared = set()
+            for file in starburst_files:
+                checks.extend(self._plan_checks(file, domains, report, compared))
+
+            products = self._fetch_all(
+                executor,
+                [
+                    key
+                    for src_key, dest_key, *_ in checks
+                    for key in (src_key, dest_key)
+                ],
+                self._fetch_product,
+            )
+
+        for src_key, dest_key, full, datasets, transform in checks:
+            product_src = products[src_key]
+            if (
+                product_src
+                and transform is not None
+                and not isinstance(product_src, _FetchError)
+            ):
+                # Compare with the source as it has been written to the destination
+                product_src = copy.deepcopy(product_src)
+                if full:
+                    transform.transform_product(product_src)
+                else:
+                    transform.transform_datasets(
+                        product_src.views + product_src.materialized_views
+                    )
+            self._compare_products(
+                report, product_src, products[dest_key], dest_key, full, datasets
+            )
+        return report
+
+    def _plan_checks(self, file: StarburstFile, domains, report, compared):
+        """
+        Compares the domains of a file and lists the product comparisons it requires.
+
+        A domain is counted once, even when several files target it, and only when it is
+        missing or migrated by the file: the content of the other domains is not compared.
+
+        Args:
+            compared (set): The DomainPair already counted in the report, updated by the call.
+
+        Returns:
+            list: Tuples (source product key, destination product key, full comparison, datasets,
+                  transformations of the file).
+        """
+        domain_src = domains[("src", file.domains.src)]
+        domain_dest = domains[("dest", file.domains.dest)]
+        failed = isinstance(domain_src, _FetchError) or isinstance(
+            domain_dest, _FetchError
+        )
+        missing = failed or not domain_src or not domain_dest
+        if (missing or file.migrate_domain) and file.domains not in compared:
+            compared.add(file.domains)
+            if failed:
+                reason = "error"
+            elif missing:
+                reason = "missing at source" if not domain_src else "missing"
+            elif content_hash(domain_src) != content_hash(domain_dest):
+                reason = "content"
+            else:
+                reason = None
+            report.add("domain", file.domains.dest, reason=reason)
+        if missing:
+            return []
+
+        def key(side, product_name):
+            domain_name = file.domains.src if side == "src" else file.domains.dest
+            return (side, domain_name, product_name)
+
+        if file.products is None:
+            return [
+                (
+                    key("src", product["name"]),
+                    key("dest", product["name"]),
+                    True,
+                    None,
+                    file.transform,
+                )
+                for product in domain_src.assigned_data_products
+            ]
+
+        checks = []
+        for product in file.products:
+            if product.datasets is None:
+                dest_name = product.dest or product.src
+                checks.append(
+                    (
+                        key("src", product.src),
+                        key("dest", dest_name),
+                        not product.dest,
+                        None,
+                        file.transform,
+                    )
+                )
+                continue
+            targets = {}
+            for dataset in product.datasets:
+                targets.setdefault(dataset.product_dest or product.dest, []).append(
+                    dataset
+                )
+            for dest_name, datasets in targets.items():
+                checks.append(
+                    (
+                        key("src", product.src),
+                        key("dest", dest_name),
+                        False,
+                        datasets,
+                        file.transform,
+                    )
+                )
+        return checks
+
+    def _compare_products(
+        self, report, product_src, product_dest, dest_key, full, datasets
+    ):
+        """
+        Compares a source product with its destination product, and their datasets.
+
+        Args:
+            report (VerificationReport): The report to fill.
+            product_src: The source product, None if not found or a _FetchError.
+            product_dest: The destination product, None if not found or a _FetchError.
+            dest_key (tuple): The (side, domain name, product name) of the destination product.
+            full (bool): Whether the product itself has been migrated, not only its datasets.
+            datasets (list): The DatasetSpec to compare, or None to compare all source datasets.
+        """
+        _, domain_name, product_name = dest_key
+        if isinstance(product_src, _FetchError) or isinstance(
+            product_dest, _FetchError
+        ):
+            report.add("product", domain_name, product_name, reason="error")
+            return
+        if not product_src or not product_dest:
+            report.add(
+                "product",
+                domain_name,
+                product_name,
+                reason="missing at source" if not product_src else "missing",
+            )
+            return
+
+        if full:
+            ignored = VOLATILE_FIELDS.union(DATASET_FIELDS)
+            report.add(
+                "product",
+                domain_name,
+                product_name,
+                reason="content"
+                if content_hash(product_src, ignored)
+                != content_hash(product_dest, ignored)
+                else None,
+            )
+
+        if datasets is None:
+            wanted = [
+                (field, dataset.name)
+                for field in DATASET_FIELDS
+                for dataset in getattr(product_src, field)
+            ]
+        else:
+            wanted = [(f"{dataset.type}s", dataset.name) for dataset in datasets]
+
+        for field, name in wanted:
+            src = next(
+                (dts for dts in getattr(product_src, field) if dts.name == name), None
+            )
+            dest = next(
+                (dts for dts in getattr(product_dest, field) if dts.name == name), None
+            )
+            if src is None:
+                reason = "missing at source"
+            elif dest is None:
+                reason = "missing"
+            elif content_hash(src) != content_hash(dest):
+                reason = "content"
+            else:
+                reason = None
+            report.add("dataset", domain_name, product_name, name, reason)
@@ -0,0 +1,20 @@
+"""
+Profiler used when profiling is off
+
+Kept apart from ``profiling``, so that modules taking an optional profiler do not import
+cProfile, pstats and tracemalloc.
+"""
+import contextlib
+
+
+class _NullProfiler:
+    """Profiler used when profiling is off, its phases do nothing."""
+
+    enabled = False
+    _phase = contextlib.nullcontext()
+
+    def phase(self, name: str):
+        return self._phase
+
+
+NULL_PROFILER = _NullProfiler()
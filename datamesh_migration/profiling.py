@@ -0,0 +1,145 @@
+"""
+Opt-in profiling of migration runs with cProfile and tracemalloc
+"""
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+PHASES = ("load", "validate", "fetch", "transform", "write")
+
+
+class MigrationProfiler:
+    """
+    Profile the phases of a migration run and write a report per phase.
+
+    Used as a context manager around the run: tracemalloc is started on enter, and the reports
+    are written to the directory on exit:
+
+    - ``<phase>.prof`` and ``<phase>.txt``: the cProfile stats of each phase, as pstats dump and text.
+    - ``allocations.txt``: the top allocation sites of the run.
+    - ``summary.json``: the calls, duration and traced memory delta of each phase.
+
+    cProfile can only profile one thread at a time: when several threads run phases concurrently,
+    only the phases of the first thread are profiled, the others are only timed.
+    """
+
+    enabled = True
+
+    def __init__(self, directory: str, top: int = 25):
+        """
+        Args:
+            directory (str): The directory of the reports, created if missing.
+            top (int): The number of functions and allocation sites listed in the text reports.
+        """
+        self.directory = directory
+        self.top = top
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._owner = None
+        self._started_tracemalloc = False
+        self._profiles = {}
+        self._summary = {}
+
+    def __enter__(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        return self
+
+    def __exit__(self, *exc_info):
+        snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        self.write_reports(snapshot)
+        return False
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """
+        Profiles the code run inside the context as part of a phase.
+
+        Args:
+            name (str): The name of the phase, one of PHASES.
+        """
+        stack = self._local.__dict__.setdefault("stack", [])
+        me = threading.get_ident()
+        with self._lock:
+            if self._owner is None:
+                self._owner = me
+            profiled = self._owner == me
+            profile = self._profiles.setdefault(name, cProfile.Profile())
+
+        if profiled:
+            if stack:
+                stack[-1].disable()
+            stack.append(profile)
+            profile.enable()
+        memory = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            memory = tracemalloc.get_traced_memory()[0] - memory
+            if profiled:
+                stack.pop().disable()
+                if stack:
+                    stack[-1].enable()
+            with self._lock:
+                if profiled and not stack:
+                    self._owner = None
+                summary = self._summary.setdefault(
+                    name,
+                    {"calls": 0, "profiled_calls": 0, "seconds": 0.0, "memory": 0},
+                )
+                summary["calls"] += 1
+                summary["profiled_calls"] += profiled
+                summary["seconds"] += elapsed
+                summary["memory"] += memory
+
+    def write_reports(self, snapshot=None):
+        """
+        Writes the reports of the profiled phases.
+
+        Args:
+            snapshot (tracemalloc.Snapshot): The snapshot of the allocations, or None.
+
+        Returns:
+            dict: The summary of each phase.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            summary = {
+                name: dict(phase, seconds=round(phase["seconds"], 6))
+                for name, phase in self._summary.items()
+            }
+            profiles = dict(self._profiles)
+
+        for name, phase in summary.items():
+            if not phase["profiled_calls"]:
+                continue
+            profile_path = os.path.join(self.directory, f"{name}.prof")
+            profiles[name].dump_stats(profile_path)
+            stream = io.StringIO()
+            pstats.Stats(profile_path, stream=stream).sort_stats(
+                "cumulative"
+            ).print_stats(self.top)
+            with open(os.path.join(self.directory, f"{name}.txt"), "w") as file:
+                file.write(stream.getvalue())
+
+        if snapshot is not None:
+            with open(os.path.join(self.directory, "allocations.txt"), "w") as file:
+                for statistic in snapshot.statistics("lineno")[: self.top]:
+                    file.write(f"{statistic}\n")
+
+        with open(os.path.join(self.directory, "summary.json"), "w") as file:
+            json.dump(summary, file, indent=2)
+        print(f"Profiling reports written to {self.directory}")
+        return summary
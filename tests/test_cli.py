@@ -0,0 +1,99 @@
+"""
+Tests of the datamesh-migrate command on commands which contact no instance
+"""
+import argparse
+import json
+
+import pytest
+
+from datamesh_migration.cli import _budget, build_parser, main
+
+
+def write_files(directory, **contents):
+    for name, content in contents.items():
+        (directory / f"{name}.starburst").write_text(json.dumps(content))
+    return str(directory)
+
+
+VALID = {
+    "domainNameSrc": "sales",
+    "domainNameDest": "sales_prd",
+    "dataProducts": [{"productSrcName": "orders"}],
+}
+
+
+def test_validate_exits_with_1_when_a_file_is_invalid(tmp_path, capsys):
+    directory = write_files(tmp_path, valid=VALID, invalid={"unknown": "field"})
+
+    assert main(["validate", directory]) == 1
+    assert "invalid: 1" in capsys.readouterr().out
+
+
+def test_validate_and_plan_exit_with_0_when_every_file_is_valid(tmp_path):
+    directory = write_files(tmp_path, valid=VALID)
+
+    assert main(["validate", directory]) == 0
+    assert main(["plan", directory]) == 0
+
+
+def test_plan_leaves_invalid_files_out_and_exits_with_1(tmp_path, capsys):
+    directory = write_files(
+        tmp_path,
+        valid=VALID,
+        invalid={"domainNameSrc": "sales", "transformations": {"replace": [{}]}},
+    )
+
+    assert main(["--format", "json", "plan", directory]) == 1
+    assert json.loads(capsys.readouterr().out) == {
+        "valid.starburst": ["migrate product sales/orders into domain sales_prd"]
+    }
+
+
+def test_a_bad_replacement_makes_the_file_invalid(tmp_path, capsys):
+    replace = [{"pattern": "dev", "replacement": "\\1"}]
+    invalid = {**VALID, "transformations": {"replace": replace}}
+    directory = write_files(tmp_path, valid=VALID, invalid=invalid)
+
+    assert main(["--format", "json", "validate", directory]) == 1
+    assert json.loads(capsys.readouterr().out)["invalid"] == 1
+
+
+def test_json_format_keeps_the_logs_out_of_stdout(tmp_path, capsys):
+    directory = write_files(tmp_path, valid=VALID)
+
+    assert main(["--format", "json", "validate", directory]) == 0
+    captured = capsys.readouterr()
+    assert json.loads(captured.out) == {"files": 1, "valid": 1, "invalid": 0}
+    assert "valid.starburst is valid" in captured.err
+
+
+def test_budget_parsing():
+    assert _budget("fetch=1.5") == ("fetch", 1.5)
+    assert _budget("write=0") == ("write", 0.0)
+    with pytest.raises(argparse.ArgumentTypeError):
+        _budget("load=1")
+    with pytest.raises(argparse.ArgumentTypeError):
+        _budget("fetch=soon")
+
+
+def test_time_limits_are_parsed_before_the_command():
+    args = build_parser().parse_args(
+        [
+            "--deadline",
+            "0",
+            "--call-timeout",
+            "2",
+            "--budget",
+            "fetch=1",
+            "--budget",
+            "write=3",
+            "apply",
+            "files",
+        ]
+    )
+
+    assert args.deadline == 0.0
+    assert args.call_timeout == 2.0
+    assert args.budget == [("fetch", 1.0), ("write", 3.0)]
+    assert args.workers == 8
+    assert args.shards == 1
@@ -0,0 +1,107 @@
+"""
+Tests of the deadline, call timeouts and phase budgets of migrations
+"""
+import pickle
+import threading
+import time
+
+import pytest
+
+from datamesh_migration.migrators.deadline import Deadline, MigrationTimeout
+
+
+def test_timed_call_exceeding_its_timeout_raises():
+    deadline = Deadline(call_timeout=0.05)
+
+    with pytest.raises(MigrationTimeout) as error:
+        deadline.run("fetch", lambda: time.sleep(1))
+    assert error.value.phase == "fetch"
+
+
+def test_untimed_call_runs_to_its_end():
+    deadline = Deadline(call_timeout=0.05)
+    written = []
+
+    def write():
+        time.sleep(0.2)
+        written.append("product")
+        return 200
+
+    assert deadline.run("write", write, timed=False) == 200
+    assert written == ["product"]
+
+
+def test_call_is_not_started_after_the_deadline():
+    deadline = Deadline(timeout=0)
+    calls = []
+
+    with pytest.raises(MigrationTimeout):
+        deadline.run("write", lambda: calls.append(1), timed=False)
+    assert deadline.expired
+    assert calls == []
+
+
+def test_spent_budget_stops_the_phase_only():
+    deadline = Deadline(phase_budgets={"fetch": 0.05})
+    deadline.run("fetch", lambda: time.sleep(0.06), timed=False)
+
+    with pytest.raises(MigrationTimeout):
+        deadline.run("fetch", lambda: None)
+    assert deadline.run("write", lambda: 200, timed=False) == 200
+
+
+def test_errors_of_timed_calls_are_raised():
+    deadline = Deadline(call_timeout=1)
+
+    with pytest.raises(KeyError):
+        deadline.run("fetch", lambda: {}["missing"])
+
+
+def test_timed_calls_reuse_their_threads():
+    deadline = Deadline(call_timeout=1)
+    threads = threading.active_count()
+
+    results = [deadline.run("fetch", lambda value=value: value) for value in range(50)]
+
+    assert results == list(range(50))
+    assert deadline._pool.threads == 1
+    assert threading.active_count() <= threads + 1
+
+
+def test_concurrent_timed_calls_run_in_parallel():
+    deadline = Deadline(call_timeout=1)
+    barrier = threading.Barrier(3, timeout=1)
+    outcomes = []
+
+    def call():
+        outcomes.append(deadline.run("fetch", barrier.wait))
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(2)
+
+    assert sorted(outcomes) == [0, 1, 2]
+    assert deadline._pool.threads == 3
+
+
+def test_pickled_deadline_keeps_its_limits():
+    deadline = Deadline(timeout=60, call_timeout=5, phase_budgets={"write": 10})
+    deadline.run("write", lambda: time.sleep(0.05), timed=False)
+
+    copy = pickle.loads(pickle.dumps(deadline))
+
+    assert copy.expires_at == deadline.expires_at
+    assert copy.call_timeout == 5
+    assert copy.remaining_budgets()["write"] < 10
+
+
+def test_shares_split_the_budgets_left():
+    deadline = Deadline(timeout=60, call_timeout=5, phase_budgets={"fetch": 9})
+
+    share = deadline.share(3)
+
+    assert share.expires_at == deadline.expires_at
+    assert share.call_timeout == 5
+    assert share.remaining_budgets() == {"fetch": pytest.approx(3)}
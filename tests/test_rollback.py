@@ -0,0 +1,110 @@
+"""
+Tests of the rollback journal recording the destination entities before they are written
+"""
+import os
+import pickle
+
+from datamesh_migration.migrators.rollback import RollbackJournal, read_journal
+
+
+class Entity:
+    def __init__(self, name, tags):
+        self.name = name
+        self.tags = tags
+
+
+def summary(records):
+    return [
+        (
+            record["kind"],
+            record["domain"],
+            record["name"],
+            record["action"],
+            record["entity"] and record["entity"].tags,
+        )
+        for record in records
+    ]
+
+
+def test_capture_keeps_the_first_state_of_an_entity(tmp_path):
+    path = str(tmp_path / "rollback.gz")
+    journal = RollbackJournal(path)
+    entity = Entity("product", ["a"])
+
+    journal.capture("product", "sales", "product", entity)
+    entity.tags.append("b")
+    journal.capture("product", "sales", "product", entity)
+    journal.capture("product", "sales", "new")
+    journal.capture("domain", "sales", "sales", Entity("sales", []))
+
+    assert summary(read_journal(path)) == [
+        ("product", "sales", "product", "update", ["a"]),
+        ("product", "sales", "new", "create", None),
+        ("domain", "sales", "sales", "update", []),
+    ]
+
+
+def test_capture_does_not_pickle_an_entity_already_captured(tmp_path):
+    path = str(tmp_path / "rollback.gz")
+    RollbackJournal(path).capture("product", "sales", "product", Entity("p", ["a"]))
+
+    class Unpicklable:
+        def __reduce__(self):
+            raise pickle.PicklingError("pickled")
+
+    # Reopened journals know the entities already captured
+    RollbackJournal(path).capture("product", "sales", "product", Unpicklable())
+
+    assert summary(read_journal(path)) == [
+        ("product", "sales", "product", "update", ["a"])
+    ]
+
+
+def test_absorb_appends_and_removes_the_other_journal(tmp_path):
+    path = str(tmp_path / "rollback.gz")
+    shard_path = f"{path}.shard0"
+    journal = RollbackJournal(path)
+    journal.capture("product", "sales", "p1", Entity("p1", ["main"]))
+    shard = RollbackJournal(shard_path)
+    shard.capture("product", "sales", "p1", Entity("p1", ["shard"]))
+    shard.capture("product", "sales", "p2", Entity("p2", ["shard"]))
+
+    journal.absorb(shard_path)
+    journal.absorb(f"{path}.missing")
+    journal.capture("product", "sales", "p2", Entity("p2", ["late"]))
+
+    assert not os.path.exists(shard_path)
+    assert summary(read_journal(path)) == [
+        ("product", "sales", "p1", "update", ["main"]),
+        ("product", "sales", "p2", "update", ["shard"]),
+    ]
+
+
+def test_read_journal_stops_at_a_truncated_last_record(tmp_path):
+    path = str(tmp_path / "rollback.gz")
+    journal = RollbackJournal(path)
+    journal.capture("product", "sales", "p1", Entity("p1", ["a"]))
+    size = os.path.getsize(path)
+    journal.capture("product", "sales", "p2", Entity("p2", ["b"]))
+    with open(path, "r+b") as file:
+        file.truncate(size + (os.path.getsize(path) - size) // 2)
+
+    assert summary(read_journal(path)) == [
+        ("product", "sales", "p1", "update", ["a"])
+    ]
+
+
+def test_read_journal_stops_at_a_corrupted_record(tmp_path, capsys):
+    path = str(tmp_path / "rollback.gz")
+    RollbackJournal(path).capture("product", "sales", "p1", Entity("p1", ["a"]))
+    with open(path, "ab") as file:
+        file.write(b"not a gzip member")
+
+    assert summary(read_journal(path)) == [
+        ("product", "sales", "p1", "update", ["a"])
+    ]
+    assert "corrupted record" in capsys.readouterr().out
+
+
+def test_read_journal_of_a_missing_file_is_empty(tmp_path):
+    assert read_journal(str(tmp_path / "missing.gz")) == []
@@ -0,0 +1,100 @@
+"""
+Tests of the coalescing of concurrent identical lookups
+"""
+import threading
+import time
+
+import pytest
+
+from datamesh_migration.migrators.single_flight import SingleFlight
+
+
+def run_concurrently(single_flight, key, function, callers):
+    """Calls ``single_flight.do`` from several threads, once the first one is in flight."""
+    started = threading.Event()
+    release = threading.Event()
+    outcomes = [None] * callers
+
+    def leader_function():
+        started.set()
+        release.wait(5)
+        return function()
+
+    def call(index):
+        try:
+            outcomes[index] = ("result", single_flight.do(key, leader_function))
+        except Exception as err:
+            outcomes[index] = ("error", err)
+
+    threads = [threading.Thread(target=call, args=(0,))]
+    threads[0].start()
+    assert started.wait(5)
+    threads += [
+        threading.Thread(target=call, args=(index,)) for index in range(1, callers)
+    ]
+    for thread in threads[1:]:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while single_flight.shared < callers - 1 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    return outcomes
+
+
+def test_concurrent_calls_share_one_call():
+    single_flight = SingleFlight()
+    calls = []
+
+    def function():
+        calls.append(1)
+        return {"name": "product", "views": ["v1"]}
+
+    outcomes = run_concurrently(single_flight, "key", function, 5)
+
+    assert len(calls) == 1
+    assert single_flight.shared == 4
+    assert all(outcome == ("result", outcomes[0][1]) for outcome in outcomes)
+
+
+def test_callers_get_independent_copies():
+    single_flight = SingleFlight()
+
+    outcomes = run_concurrently(single_flight, "key", lambda: {"views": ["v1"]}, 3)
+    results = [result for _, result in outcomes]
+    results[0]["views"].append("v2")
+
+    assert results[1] == results[2] == {"views": ["v1"]}
+    assert results[1] is not results[2]
+
+
+def test_errors_are_raised_in_every_caller():
+    single_flight = SingleFlight()
+
+    def function():
+        raise ValueError("lookup failed")
+
+    outcomes = run_concurrently(single_flight, "key", function, 3)
+
+    assert [kind for kind, _ in outcomes] == ["error"] * 3
+    assert all(isinstance(error, ValueError) for _, error in outcomes)
+
+
+def test_results_are_not_cached():
+    single_flight = SingleFlight()
+    calls = []
+
+    for _ in range(3):
+        single_flight.do("key", lambda: calls.append(1))
+
+    assert len(calls) == 3
+    assert single_flight.shared == 0
+
+
+def test_error_of_the_leader_is_raised():
+    single_flight = SingleFlight()
+
+    with pytest.raises(KeyError):
+        single_flight.do("key", lambda: {}["missing"])
+    assert single_flight.do("key", lambda: 1) == 1
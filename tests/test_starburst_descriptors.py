@@ -0,0 +1,68 @@
+"""
+Tests of the starburst file descriptors and their partition into shards
+"""
+import pickle
+
+import pytest
+
+from datamesh_migration.files.starburst_descriptors import (
+    DomainPair,
+    ProductSpec,
+    StarburstFile,
+    group_by_destination,
+    partition_shards,
+)
+
+
+def make_file(dest, products=0, source=None):
+    return StarburstFile(
+        DomainPair("src", dest),
+        products=[ProductSpec(f"product{index}") for index in range(products)]
+        or None,
+        source=source or f"{dest}-{products}.starburst",
+    )
+
+
+def test_group_by_destination_keeps_order():
+    files = [make_file("a", 1), make_file("b", 1), make_file("a", 2)]
+
+    assert group_by_destination(files) == [[files[0], files[2]], [files[1]]]
+
+
+def test_partition_shards_keeps_destination_domains_whole():
+    files = [make_file(dest, products) for dest in "abcde" for products in (1, 2)]
+
+    partition = partition_shards(files, 3)
+
+    assert sorted(file.source for shard in partition for file in shard) == sorted(
+        file.source for file in files
+    )
+    owners = {}
+    for index, shard in enumerate(partition):
+        for file in shard:
+            assert owners.setdefault(file.domains.dest, index) == index
+
+
+def test_partition_shards_balances_weights():
+    files = [make_file("a", 6), make_file("b", 3), make_file("c", 3)]
+
+    partition = partition_shards(files, 2)
+
+    assert sorted(
+        sum(len(file.products) for file in shard) for shard in partition
+    ) == [6, 6]
+
+
+def test_partition_shards_drops_empty_shards():
+    files = [make_file("a"), make_file("b")]
+
+    assert len(partition_shards(files, 4)) == 2
+    assert partition_shards([], 4) == []
+
+
+def test_starburst_file_is_immutable_and_picklable():
+    file = make_file("a", 2)
+
+    assert pickle.loads(pickle.dumps(file)) == file
+    with pytest.raises(AttributeError):
+        file.source = "other"
@@ -0,0 +1,132 @@
+"""
+Tests of the transformations applied to data products before they are written
+"""
+import pickle
+
+from datamesh_migration.files.starburst_descriptors import DomainPair, StarburstFile
+from datamesh_migration.files.starburst_transformations import (
+    TransformationPipeline,
+    validate_transformations,
+)
+
+
+class Dataset:
+    def __init__(self, name, definition_query):
+        self.name = name
+        self.definition_query = definition_query
+
+
+class Product:
+    def __init__(self, views, materialized_views=(), catalog_name="dev"):
+        self.catalog_name = catalog_name
+        self.views = list(views)
+        self.materialized_views = list(materialized_views)
+
+
+def test_replace_patterns_apply_to_each_query():
+    pipeline = TransformationPipeline(
+        {
+            "replace": [
+                {"pattern": "^SELECT", "replacement": "SELECT /*x*/"},
+                {"pattern": "1$", "replacement": "one"},
+            ]
+        }
+    )
+
+    assert pipeline.rewrite_sql(["SELECT 1", "SELECT 2", "SELECT 1"]) == [
+        "SELECT /*x*/ one",
+        "SELECT /*x*/ 2",
+        "SELECT /*x*/ one",
+    ]
+
+
+def test_catalogs_and_schemas_are_renamed():
+    pipeline = TransformationPipeline(
+        {"catalogs": {"dev": "prod"}, "schemas": {"sales": "sales_prd"}}
+    )
+
+    assert pipeline.rewrite_sql(
+        [
+            "SELECT * FROM dev.sales.t JOIN sales.u ON t.id = u.id",
+            'SELECT * FROM "DEV"."Sales"."t"',
+            "SELECT * FROM other.sales.t, dev.other.t, a.b.c.d",
+        ]
+    ) == [
+        "SELECT * FROM prod.sales_prd.t JOIN sales_prd.u ON t.id = u.id",
+        'SELECT * FROM "prod"."sales_prd"."t"',
+        "SELECT * FROM other.sales_prd.t, prod.other.t, a.b.c.d",
+    ]
+
+
+def test_string_literals_are_not_renamed():
+    pipeline = TransformationPipeline({"schemas": {"sales": "sales_prd"}})
+
+    assert pipeline.rewrite_sql(
+        [
+            "SELECT 'sales.y', 'it''s sales.y' FROM sales.y",
+            'SELECT "it\'s" FROM sales.y',
+        ]
+    ) == [
+        "SELECT 'sales.y', 'it''s sales.y' FROM sales_prd.y",
+        'SELECT "it\'s" FROM sales_prd.y',
+    ]
+
+
+def test_queries_are_renamed_independently():
+    pipeline = TransformationPipeline({"schemas": {"sales": "sales_prd"}})
+
+    assert pipeline.rewrite_sql(["SELECT 'unterminated", "SELECT * FROM sales.y"]) == [
+        "SELECT 'unterminated",
+        "SELECT * FROM sales_prd.y",
+    ]
+
+
+def test_transform_product_rewrites_product_and_datasets():
+    pipeline = TransformationPipeline(
+        {"catalogs": {"dev": "prod"}, "owners": [{"name": "team"}], "tags": ["prod"]}
+    )
+    product = Product(
+        [Dataset("v1", "SELECT * FROM dev.s.t")],
+        [Dataset("mv1", "SELECT * FROM dev.s.u")],
+    )
+
+    pipeline.transform_product(product)
+
+    assert product.catalog_name == "prod"
+    assert product.owners == [{"name": "team"}]
+    assert product.tags == ["prod"]
+    assert [dataset.definition_query for dataset in product.views] == [
+        "SELECT * FROM prod.s.t"
+    ]
+    assert [dataset.definition_query for dataset in product.materialized_views] == [
+        "SELECT * FROM prod.s.u"
+    ]
+
+
+def test_pipelines_compare_by_configuration_after_pickling():
+    config = {"schemas": {"sales": "sales_prd"}, "replace": []}
+    pipeline = TransformationPipeline(config)
+    file = StarburstFile(DomainPair("a", "b"), transform=pipeline)
+
+    assert pipeline == TransformationPipeline(dict(config))
+    assert hash(pipeline) == hash(TransformationPipeline(dict(config)))
+    assert pickle.loads(pickle.dumps(file)) == file
+    unpickled = pickle.loads(pickle.dumps(pipeline))
+    assert unpickled.rewrite_sql(["FROM sales.y"]) == ["FROM sales_prd.y"]
+
+
+def test_validate_transformations():
+    assert validate_transformations({"catalogs": {"dev": "prod"}, "tags": ["a"]})
+    assert not validate_transformations({"unknown": {}})
+    assert not validate_transformations({"schemas": {"a": ""}})
+    assert not validate_transformations({"replace": [{"pattern": "("}]})
+    assert not validate_transformations(
+        {"replace": [{"pattern": "(", "replacement": ""}]}
+    )
+    assert validate_transformations(
+        {"replace": [{"pattern": "(?P<x>a)(b)", "replacement": r"\g<x>\2"}]}
+    )
+    for replacement in (None, 1, r"\1", r"\g<x>", "\\"):
+        assert not validate_transformations(
+            {"replace": [{"pattern": "a", "replacement": replacement}]}
+        )
@@ -0,0 +1,182 @@
+"""
+Tests of the verification of migrated entities between two instances
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from datamesh_migration.files.starburst_descriptors import (
+    DatasetSpec,
+    DomainPair,
+    ProductSpec,
+    StarburstFile,
+)
+from datamesh_migration.migrators.verification import (
+    DatameshVerifier,
+    VerificationReport,
+    content_hash,
+    normalize,
+)
+
+
+class Entity:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+def make_product(views=(), materialized_views=(), **fields):
+    return Entity(
+        name="product",
+        views=[Entity(name=name, definition_query=query) for name, query in views],
+        materialized_views=[
+            Entity(name=name, definition_query=query)
+            for name, query in materialized_views
+        ],
+        **fields,
+    )
+
+
+def reasons(report):
+    return [
+        (mismatch.level, mismatch.dataset, mismatch.reason)
+        for mismatch in report.mismatches
+    ]
+
+
+def test_normalize_drops_volatile_fields_at_every_level():
+    entity = Entity(
+        id="1", name="product", views=[Entity(id="2", name="v1")], tags=("a",)
+    )
+
+    assert normalize(entity) == {
+        "name": "product",
+        "views": [{"name": "v1"}],
+        "tags": ["a"],
+    }
+
+
+def test_content_hash_ignores_volatile_fields_and_key_order():
+    assert content_hash({"a": 1, "b": 2, "id": "x"}) == content_hash(
+        Entity(b=2, a=1, id="y")
+    )
+    assert content_hash({"a": 1}) != content_hash({"a": 2})
+    assert content_hash({"a": 1, "b": 2}, frozenset({"b"})) == content_hash({"a": 1})
+
+
+def test_plan_checks_counts_a_shared_domain_once():
+    verifier = DatameshVerifier(None, None)
+    domains = {
+        ("src", "a"): Entity(name="a", assigned_data_products=[{"name": "p1"}]),
+        ("dest", "b"): Entity(name="a", assigned_data_products=[]),
+    }
+    files = [
+        StarburstFile(DomainPair("a", "b"), migrate_domain=True),
+        StarburstFile(
+            DomainPair("a", "b"),
+            products=[
+                ProductSpec("p2", "p3"),
+                ProductSpec("p4", "p5", (DatasetSpec("v1", "view", "p6"),)),
+            ],
+            migrate_domain=True,
+        ),
+    ]
+    report = VerificationReport()
+    compared = set()
+
+    checks = [
+        check[:4]
+        for file in files
+        for check in verifier._plan_checks(file, domains, report, compared)
+    ]
+
+    assert report.checked["domain"] == 1
+    assert report.ok
+    assert checks == [
+        (("src", "a", "p1"), ("dest", "b", "p1"), True, None),
+        (("src", "a", "p2"), ("dest", "b", "p3"), False, None),
+        (
+            ("src", "a", "p4"),
+            ("dest", "b", "p6"),
+            False,
+            [DatasetSpec("v1", "view", "p6")],
+        ),
+    ]
+
+
+def test_plan_checks_skips_the_products_of_a_missing_domain():
+    verifier = DatameshVerifier(None, None)
+    domains = {("src", "a"): Entity(name="a"), ("dest", "b"): None}
+    report = VerificationReport()
+
+    checks = verifier._plan_checks(
+        StarburstFile(DomainPair("a", "b")), domains, report, set()
+    )
+
+    assert checks == []
+    assert reasons(report) == [("domain", None, "missing")]
+
+
+def test_compare_products_reports_dataset_mismatches():
+    verifier = DatameshVerifier(None, None)
+    product_src = make_product(
+        [("v1", "SELECT 1"), ("v2", "SELECT 2")], [("mv1", "SELECT 3")], id="1"
+    )
+    product_dest = make_product([("v1", "SELECT 1"), ("v2", "SELECT 0")], id="2")
+    report = VerificationReport()
+
+    verifier._compare_products(
+        report, product_src, product_dest, ("dest", "b", "product"), True, None
+    )
+
+    assert report.checked == {"domain": 0, "product": 1, "dataset": 3}
+    assert reasons(report) == [
+        ("dataset", "v2", "content"),
+        ("dataset", "mv1", "missing"),
+    ]
+
+
+def test_compare_products_only_compares_the_given_datasets():
+    verifier = DatameshVerifier(None, None)
+    product_src = make_product([("v1", "SELECT 1"), ("v2", "SELECT 2")], owner="a")
+    product_dest = make_product([("v1", "SELECT 1")], owner="b")
+    report = VerificationReport()
+
+    verifier._compare_products(
+        report,
+        product_src,
+        product_dest,
+        ("dest", "b", "product"),
+        False,
+        [DatasetSpec("v1", "view"), DatasetSpec("v3", "view")],
+    )
+
+    assert report.checked == {"domain": 0, "product": 0, "dataset": 2}
+    assert reasons(report) == [("dataset", "v3", "missing at source")]
+
+
+def test_failed_fetches_are_reported_as_errors():
+    verifier = DatameshVerifier(None, None)
+
+    def fetch(key):
+        if key[1] == "broken":
+            raise ConnectionError("unreachable")
+        return Entity(name=key[1], assigned_data_products=[])
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        domains = verifier._fetch_all(
+            executor, [("src", "a"), ("dest", "broken"), ("src", "a")], fetch
+        )
+    report = VerificationReport()
+    checks = verifier._plan_checks(
+        StarburstFile(DomainPair("a", "broken")), domains, report, set()
+    )
+    verifier._compare_products(
+        report,
+        domains[("dest", "broken")],
+        make_product(),
+        ("dest", "b", "product"),
+        True,
+        None,
+    )
+
+    assert list(domains) == [("src", "a"), ("dest", "broken")]
+    assert checks == []
+    assert reasons(report) == [("domain", None, "error"), ("product", None, "error")]